@@ -0,0 +1,48 @@
+"""Compares per-sprite blitting with the batched Surface.blits path.
+
+Run from the repository root with ``python -m benchmarks.blits``.
+"""
+import os
+import random
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame as pg
+
+from engine.settings import *
+from engine.camera import Camera
+from engine.blitting import blit_batched, blit_each, sprite_items
+from engine.loaders.image_cache import image_cache
+
+SPRITE_COUNTS = (100, 1000, 5000, 20000)
+REPEAT = 20
+
+
+def make_sprites(count):
+    images = [image_cache.get(name) for name in ("grass/flat", "dirt_tile", "overlay seed tile")]
+    sprites = []
+    for _ in range(count):
+        sprite = pg.sprite.Sprite()
+        sprite.image = random.choice(images)
+        sprite.rect = sprite.image.get_rect(topleft=(random.randrange(-200, WIDTH), random.randrange(-200, HEIGHT)))
+        sprites.append(sprite)
+    return sprites
+
+
+def main():
+    pg.init()
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    camera = Camera(WIDTH, HEIGHT)
+    print(f"{'sprites':>8} {'blit ms':>10} {'blits ms':>10} {'speedup':>8}")
+    for count in SPRITE_COUNTS:
+        sprites = make_sprites(count)
+        each = timeit.timeit(lambda: blit_each(screen, sprites, camera), number=REPEAT) / REPEAT
+        batched = timeit.timeit(
+            lambda: blit_batched(screen, sprite_items(sprites), camera.camera.topleft), number=REPEAT) / REPEAT
+        print(f"{count:>8} {each * 1000:>10.3f} {batched * 1000:>10.3f} {each / batched:>7.2f}x")
+    pg.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Times crop growth steps on a large farm.
+
+The farm is timed as loaded from a save, with first growth attempts spread
+out, and with every crop planted on the same step, so the whole farm is due
+together, which is the worst case. Steps are timed for the simulation alone
+and including the write back into the world.
+
+Run from the repository root with ``python -m benchmarks.growth``.
+"""
+import argparse
+import math
+import os
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from engine.settings import FPS
+from engine.game import Game
+from engine.world import BACKGROUND, FOREGROUND
+
+
+def run(game, steps, spread):
+    """Replants the farm and times steps. Returns the step times, in
+    seconds, of the simulation alone and including the world update."""
+    lookup = game.TileLookup.lookup_from_title
+    seeds = np.where(np.asarray(game.world.layer_array(FOREGROUND)) != 0, lookup("orange tulip:seed"), 0)
+    game.world.load_layer(FOREGROUND, seeds.tolist())
+    game.growth[FOREGROUND].load(seeds, spread=spread)
+
+    growth = game.growth[FOREGROUND]
+    kernel = []
+    total = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        xs, ys, ids = growth.step()
+        middle = time.perf_counter()
+        if len(ids):
+            game.world.set_cells(FOREGROUND, xs, ys, ids)
+            game.world.check_update_grid()
+        end = time.perf_counter()
+        kernel.append(middle - start)
+        total.append(end - start)
+    return np.array(kernel) * 1000, np.array(total) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crops", type=int, default=100_000, help="number of crops planted")
+    parser.add_argument("--steps", type=int, default=3000, help="growth steps to run")
+    args = parser.parse_args(argv)
+
+    side = math.isqrt(args.crops - 1) + 1
+    game = Game(width=side, height=side, networking=False)
+    game.world.fill(BACKGROUND, game.TileLookup.lookup_from_title("dirt"))
+    farm = np.zeros((side, side), dtype=np.int64)
+    farm.flat[:args.crops] = game.TileLookup.lookup_from_title("orange tulip:seed")
+    game.world.load_layer(FOREGROUND, farm.tolist())
+    game.schedule_all_growth()
+
+    print(f"{args.crops} crops, {args.steps} steps, frame budget {1000 / FPS:.1f} ms")
+    print(f"{'':>16} {'mean ms':>10} {'worst ms':>10} {'+world mean':>12} {'+world worst':>13}")
+    for name, spread in (("loaded", True), ("planted at once", False)):
+        kernel, total = run(game, args.steps, spread)
+        print(f"{name:>16} {kernel.mean():>10.3f} {kernel.max():>10.3f} {total.mean():>12.3f} {total.max():>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
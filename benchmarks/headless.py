@@ -0,0 +1,119 @@
+"""Headless render benchmark for build machines without a display.
+
+Builds a Game on SDL's dummy video driver with networking disabled, fills
+the world with a configurable tile mix and runs frames without an FPS cap.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.headless --size 200 200 --frames 300 \\
+        --mix grass=0.6,dirt=0.3,concrete=0.1 --crops 0.5
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from engine.game import Game
+from engine.world import BACKGROUND, FOREGROUND
+
+PHASES = ("net", "simulation", "events", "update", "draw")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        title, _, weight = part.partition("=")
+        mix[title.strip()] = float(weight or 1)
+    return mix
+
+
+def populate(game, mix, crops):
+    """Fills the background from a {title: weight} mix and plants seeds on
+    a fraction of the dirt tiles."""
+    lookup = game.TileLookup.lookup_from_title
+    ids = [lookup(title) for title in mix]
+    if -1 in ids:
+        raise ValueError(f"unknown tile in mix: {list(mix)}")
+    dirt = lookup("dirt")
+    seed = lookup("orange tulip:seed")
+
+    w, h = game.world.w, game.world.h
+    background = [random.choices(ids, weights=list(mix.values()), k=h) for _ in range(w)]
+    foreground = [[seed if data == dirt and random.random() < crops else 0 for data in row] for row in background]
+    game.world.load_layer(BACKGROUND, background)
+    game.world.load_layer(FOREGROUND, foreground)
+    game.schedule_all_growth()
+
+
+def run(game, frames):
+    """Runs frames of the game loop, timing each phase."""
+    timings = dict.fromkeys(PHASES, 0.0)
+    steps = (
+        ("net", game._net_thread),
+        ("simulation", game._run_thread),
+        ("events", game.events),
+        ("update", game.update),
+        ("draw", game.draw),
+    )
+    start = time.perf_counter()
+    for _ in range(frames):
+        for phase, step in steps:
+            phase_start = time.perf_counter()
+            step()
+            timings[phase] += time.perf_counter() - phase_start
+    return time.perf_counter() - start, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, nargs=2, default=(100, 100), metavar=("W", "H"))
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("grass=0.6,dirt=0.3,concrete=0.1"),
+                        help="background tile weights, e.g. grass=0.6,dirt=0.4")
+    parser.add_argument("--crops", type=float, default=0.5, help="fraction of dirt tiles with crops")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    tracemalloc.start()
+    game = Game(*args.size, networking=False)
+    populate(game, args.mix, args.crops)
+    game.player.move(dx=args.size[0] // 2 - game.player.x, dy=args.size[1] // 2 - game.player.y)
+    # Twice, so the position is not interpolated from where the player was.
+    game.player.step()
+    game.player.step()
+    game.new()
+    # Load the chunks around the player before timing.
+    game.update()
+
+    elapsed, timings = run(game, args.frames)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report = {
+        "size": list(args.size),
+        "frames": args.frames,
+        "fps": args.frames / elapsed,
+        "phase_ms": {phase: total * 1000 / args.frames for phase, total in timings.items()},
+        "peak_traced_mb": peak / 2 ** 20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{args.size[0]}x{args.size[1]} tiles, {args.frames} frames: {report['fps']:.1f} fps")
+        for phase, ms in report["phase_ms"].items():
+            print(f"  {phase:<11} {ms:8.3f} ms/frame")
+        print(f"  peak traced memory {report['peak_traced_mb']:.1f} MB, max RSS {report['max_rss_mb']:.1f} MB")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares TileLookup with the previous scanning implementation.
+
+A catalogue of 1,000 tiles, a third of them with three growth states, is
+written to a temporary tiles.json and every lookup is timed against the
+old linear scans.
+
+Run from the repository root with ``python -m benchmarks.tile_lookup``.
+"""
+import json
+import os
+import random
+import tempfile
+import timeit
+
+from engine.loaders.tile_loader import TileFile, TileLookup
+
+TILE_COUNT = 1000
+REPEAT = 200
+
+
+class ScanningTileLookup:
+    """TileLookup as it was before it used the TileFile indexes."""
+
+    def __init__(self, tileFile):
+        self.tileFile = tileFile
+
+    def lookup_from_title(self, title):
+        for tile in self.tileFile.titles:
+            if self.tileFile.titles[tile] == title:
+                return tile
+        return -1
+
+    def lookup_tile_states(self, title):
+        head, _, _ = title.partition(':')
+        states = {}
+        for tile_title in self.tileFile.titles.items():
+            if type(tile_title[1]) is str:
+                if tile_title[1].startswith(head + ":"):
+                    states[self.lookup_from_title(tile_title[1])] = tile_title[1]
+        return states
+
+
+def make_catalogue(count):
+    tiles = {}
+    net_id = 1
+    for index in range(count):
+        if index % 3 == 0:
+            states = {"loop": False, "tickMultiplier": 1000}
+            for state in ("seed", "growing", "grown"):
+                states[state] = {"netId": net_id + len(states) / 10, "image": "not_found"}
+            tiles[f"crop {index}"] = {"multiState": True, "states": states}
+        else:
+            tiles[f"tile {index}"] = {"netId": net_id, "image": "not_found", "multiState": False}
+        net_id += 1
+    return {"tiles": tiles}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tiles.json")
+        with open(path, 'w') as outfile:
+            json.dump(make_catalogue(TILE_COUNT), outfile)
+        tile_file = TileFile(path)
+
+    lookups = {"indexed": TileLookup(tile_file), "scanning": ScanningTileLookup(tile_file)}
+    titles = random.choices(list(tile_file.titles.values()), k=REPEAT)
+    crops = [title for title in titles if ":" in title] or ["crop 0:seed"]
+    benchmarks = {
+        "lookup_from_title": lambda lookup: [lookup.lookup_from_title(title) for title in titles],
+        "lookup_tile_states": lambda lookup: [lookup.lookup_tile_states(title) for title in crops],
+    }
+
+    print(f"{len(tile_file.titles)} tile ids")
+    print(f"{'':>20} {'scanning us':>12} {'indexed us':>12} {'speedup':>8}")
+    for name, run in benchmarks.items():
+        calls = len(titles) if name == "lookup_from_title" else len(crops)
+        assert run(lookups["indexed"]) == run(lookups["scanning"])
+        times = {
+            kind: timeit.timeit(lambda: run(lookup), number=1) / calls
+            for kind, lookup in lookups.items()}
+        print(f"{name:>20} {times['scanning'] * 1e6:>12.2f} {times['indexed'] * 1e6:>12.3f} "
+              f"{times['scanning'] / times['indexed']:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
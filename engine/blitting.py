@@ -0,0 +1,17 @@
+def sprite_items(sprites):
+    """Flattens sprites into (surface, (x, y)) pairs in world coordinates."""
+    return [(sprite.image, sprite.rect.topleft) for sprite in sprites]
+
+
+def blit_batched(screen, items, offset):
+    """Draws (surface, (x, y)) pairs in world coordinates with a single
+    Surface.blits call, shifting them all by the camera offset."""
+    ox, oy = offset
+    screen.blits([(surface, (x + ox, y + oy)) for surface, (x, y) in items], doreturn=False)
+
+
+def blit_each(screen, sprites, camera):
+    """One blit and one Camera.apply Rect per sprite. Kept as the reference
+    path for benchmarks."""
+    for sprite in sprites:
+        screen.blit(sprite.image, camera.apply(sprite))
@@ -12,18 +12,26 @@ class Camera:
         self.camera = pg.Rect(0, 0, width, height)
         self.width = width
         self.height = height
-        self.iso = Converter()
+        self.iso = converter
 
     def apply(self, entity):
         return entity.rect.move(self.camera.topleft)
 
+    def screen_to_world(self, pos):
+        """Converts a screen pixel, e.g. the mouse position, to isometric pixels."""
+        return pos[0] - self.camera.x, pos[1] - self.camera.y
+
+    def view_rect(self):
+        """The area of the world, in isometric pixels, that is on screen."""
+        return pg.Rect(-self.camera.x, -self.camera.y, WIDTH, HEIGHT)
+
     def update(self, target):
         x = -target.x
         y = -target.y
         x = min(0, x)  # left
         y = min(0, y)  # top
-        x = max(-(W)+1, x)  # right
-        y = max(-(H)+1, y)  # bottom
+        x = max(-(self.width // TILEWIDTH)+1, x)  # right
+        y = max(-(self.height // TILEHEIGHT)+1, y)  # bottom
         x, y = self.iso.convert_cart(x, y)
         self.camera = pg.Rect(
             x + int(WIDTH / 2), y + int(HEIGHT / 2), self.width, self.height
@@ -0,0 +1,125 @@
+import collections
+import time
+
+import numpy as np
+import pygame as pg
+
+from .loaders.image_cache import image_cache
+
+# Chunks with more changed tiles than this are rebaked rather than redrawn.
+REDRAW_LIMIT = 32
+
+
+class ChunkLayerCache:
+    """Keeps one pre-composited surface per chunk for a layer that rarely
+    changes, so drawing the layer costs one blit per chunk instead of one
+    per tile. Changed tiles are redrawn into the surface in place; only
+    large changes drop it to be rebuilt the next time it is needed."""
+
+    def __init__(self, world, layer):
+        self.world = world
+        self.layer = layer
+        # (cx, cy) -> (surface, isometric topleft of the surface)
+        self.surfaces = {}
+        self.rebuilds = 0
+        self.redraws = 0
+        self._rebuild_times = collections.deque()
+
+    def get(self, chunk):
+        """Returns (surface, topleft) for a chunk, baking it if needed. The
+        surface is None when the layer is empty in that chunk."""
+        key = chunk.cx, chunk.cy
+        baked = self.surfaces.get(key)
+        if baked is None:
+            baked = self.surfaces[key] = self.bake(chunk)
+        return baked
+
+    def _depth_order(self, chunk):
+        """Section indices of the in-bounds cells of a chunk, back to front."""
+        cells = sorted(chunk.cells(self.world), key=lambda cell: (cell[0] + cell[1], cell[0]))
+        return np.array([chunk.index(x, y) for x, y in cells], dtype=np.int64)
+
+    def _blits(self, chunk, indices, left, top):
+        values = chunk.sections[self.layer][:]
+        iso_x, iso_y = chunk.positions(self.world.iso)
+        tile_file = self.world.game.TileFile
+        images = tile_file.images
+        blits = []
+        for index in indices.tolist():
+            data = values[index]
+            if data != 0:
+                image = images.get(data, images[tile_file.error_id])
+                blits.append((image_cache.get(image), (int(iso_x[index]) - left, int(iso_y[index]) - top)))
+        return blits
+
+    def bake(self, chunk):
+        """Draws every tile of the layer in a chunk onto a new surface, large
+        enough for any cached image on any of its cells so that tiles can
+        later be redrawn in place."""
+        self.rebuilds += 1
+        self._rebuild_times.append(time.monotonic())
+        if chunk.sections[self.layer].is_empty():
+            return None, (0, 0)
+
+        iso_x, iso_y = chunk.positions(self.world.iso)
+        max_w, max_h = image_cache.max_size()
+        left, top = int(iso_x.min()), int(iso_y.min())
+        surface = pg.Surface((int(iso_x.max()) - left + max_w, int(iso_y.max()) - top + max_h), pg.SRCALPHA)
+        if pg.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        surface.blits(self._blits(chunk, self._depth_order(chunk), left, top), doreturn=False)
+        return surface, (left, top)
+
+    def redraw(self, chunk, cells):
+        """Brings a chunk's surface up to date after the tiles at cells
+        (x, y) changed. Each cell's area is cleared and every cell whose
+        image can overlap it is blitted again, clipped to it, in the same
+        back to front order as bake()."""
+        key = chunk.cx, chunk.cy
+        baked = self.surfaces.get(key)
+        if baked is None:
+            return
+        surface, (left, top) = baked
+        if surface is None or len(cells) > REDRAW_LIMIT:
+            self.invalidate(key)
+            return
+
+        max_w, max_h = image_cache.max_size()
+        iso_x, iso_y = chunk.positions(self.world.iso)
+        px, py = iso_x - left, iso_y - top
+        order = self._depth_order(chunk)
+        bounds = surface.get_rect()
+        for x, y in cells:
+            index = chunk.index(x, y)
+            area = pg.Rect(int(px[index]), int(py[index]), max_w, max_h)
+            if not bounds.contains(area):
+                # An image larger than any cached when the chunk was baked.
+                self.invalidate(key)
+                return
+            overlapping = order[(px[order] < area.right) & (px[order] + max_w > area.left)
+                                & (py[order] < area.bottom) & (py[order] + max_h > area.top)]
+            surface.set_clip(area)
+            surface.fill((0, 0, 0, 0), area)
+            surface.blits(self._blits(chunk, overlapping, left, top), doreturn=False)
+        surface.set_clip(None)
+        self.redraws += 1
+
+    def invalidate(self, key):
+        """Drops the surface of the chunk at key so it is rebuilt on next use."""
+        self.surfaces.pop(key, None)
+
+    def clear(self):
+        self.surfaces = {}
+
+    def rebuilds_per_second(self):
+        """Number of surfaces baked during the last second."""
+        now = time.monotonic()
+        while self._rebuild_times and now - self._rebuild_times[0] > 1:
+            self._rebuild_times.popleft()
+        return len(self._rebuild_times)
+
+    def memory(self):
+        """Bytes of pixel data held by the cached surfaces."""
+        return sum(
+            surface.get_width() * surface.get_height() * surface.get_bytesize()
+            for surface, _ in self.surfaces.values() if surface is not None)
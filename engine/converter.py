@@ -1,7 +1,11 @@
+import numpy as np
+
 from .settings import *
 
+
 class Converter:
-    """Can convert cartesian to isometric coordinates."""
+    """Can convert cartesian to isometric coordinates and back. Every method
+    also accepts numpy arrays, converting whole coordinate grids at once."""
     def __init__(self):
         self.tile_width_half = TILEWIDTH_HALF
         self.tile_height_half = TILEHEIGHT_HALF
@@ -14,8 +18,29 @@ class Converter:
         return iso_x, iso_y
 
     def convert_rect(self, rect_x, rect_y):
-        cart_x = rect_x * self.tile_width_half
-        cart_y = rect_y * self.tile_height_half
-        iso_x = cart_x - cart_y
-        iso_y = (cart_x + cart_y) / 2
-        return iso_x, iso_y
+        return self.convert_cart(rect_x, rect_y)
+
+    def convert_grid(self, x0, y0, width, height):
+        """Isometric positions of every cell of a width x height block starting
+        at x0, y0, as two arrays indexed [x - x0][y - y0]."""
+        xs, ys = np.ogrid[x0:x0 + width, y0:y0 + height]
+        iso_x, iso_y = self.convert_cart(xs, ys)
+        return np.broadcast_to(iso_x, (width, height)), np.broadcast_to(iso_y, (width, height))
+
+    def convert_iso(self, iso_x, iso_y):
+        """Inverse of convert_cart, giving fractional cartesian coordinates."""
+        x = (iso_x + 2 * iso_y) / (2 * self.tile_width_half)
+        y = (2 * iso_y - iso_x) / (2 * self.tile_height_half)
+        return x, y
+
+    def pick(self, iso_x, iso_y):
+        """The cell whose tile diamond covers an isometric pixel. Tile images
+        draw their diamond in the lower half, so its top corner sits half a
+        tile right of and below the sprite's position."""
+        x, y = self.convert_iso(np.subtract(iso_x, self.tile_width_half),
+                                np.subtract(iso_y, self.tile_height_half))
+        return np.floor(x).astype(int), np.floor(y).astype(int)
+
+
+# Shared instance, the converter holds no per-use state.
+converter = Converter()
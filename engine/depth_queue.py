@@ -0,0 +1,69 @@
+import bisect
+
+
+class DepthQueue:
+    """Sprites kept in isometric drawing order, keyed on (x + y, layer).
+    Sprites sharing a key live in one bucket, so moving a sprite only touches
+    its old and new buckets and nothing is re-sorted per frame."""
+
+    def __init__(self):
+        # Sorted keys of the non-empty buckets.
+        self.keys = []
+        # key -> sprites in insertion order
+        self.buckets = {}
+        # sprite -> key
+        self.entries = {}
+
+    @staticmethod
+    def depth(x, y, layer):
+        return x + y, layer
+
+    def add(self, sprite, x, y, layer):
+        """Adds a sprite, moving it if it is already queued."""
+        self.remove(sprite)
+        key = self.depth(x, y, layer)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+            bisect.insort(self.keys, key)
+        bucket[sprite] = None
+        self.entries[sprite] = key
+
+    def remove(self, sprite):
+        key = self.entries.pop(sprite, None)
+        if key is None:
+            return
+        bucket = self.buckets[key]
+        del bucket[sprite]
+        if not bucket:
+            del self.buckets[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def move(self, sprite, x, y, layer=None):
+        """Updates the position of a sprite, adding it if it is new. layer
+        defaults to the sprite's current layer, so it is required for a
+        sprite that is not in the queue yet."""
+        old = self.entries.get(sprite)
+        if layer is None:
+            if old is None:
+                raise ValueError("a layer is needed to add a sprite that is not in the queue")
+            layer = old[1]
+        if old == self.depth(x, y, layer):
+            return
+        self.add(sprite, x, y, layer)
+
+    def items(self):
+        """Yields (key, image, topleft) in drawing order."""
+        for key in self.keys:
+            for sprite in self.buckets[key]:
+                yield key, sprite.image, sprite.rect.topleft
+
+    def __iter__(self):
+        for key in self.keys:
+            yield from self.buckets[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, sprite):
+        return sprite in self.entries
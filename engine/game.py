@@ -1,58 +1,100 @@
 import sys
 
 from .sprites import *
+from .world import World, BACKGROUND, FOREGROUND, LAYERS
 from .generators import *
 from .camera import *
+from .blitting import blit_batched
+from .depth_queue import DepthQueue
 from .converter import *
 from .economy import *
+from .growth import GrowthSimulation
 from .loaders.save_data_handler import *
 from .loaders.plugn_handler import PluginLoader
-from .loaders.tile_loader import TileFile, TileLookup
+from .loaders import world_save
+from .loaders.image_cache import image_cache
+from .loaders.tile_loader import TileLookup, load_tile_file
 from .threads.WorkerThreads import WorkerThread
-from .threads.DelayedFunctions import TimeoutFunction
 from .threads.DelayedFunctions import TodoList
+from .threads.FixedTimestep import FixedTimestep, SimulationThread
+from .threads.SimulationProcess import SimulationProcess
 from .networking.Server import ServerMain
 from .networking.Client import Client
+from .networking.buffer import Buffer
+from .types.registry import TileRegistry
 from PodSixNet.Connection import connection
+from operator import itemgetter
+import heapq
+import threading
 import time
 import os
 
+import numpy as np
+
 
 class Game:
 
-    def __init__(self):
-        """Initialize screen, pygame, map data, and settings."""
+    def __init__(self, width=W, height=H, networking=True, threaded=SIM_THREAD, process=SIM_PROCESS):
+        """Initialize screen, pygame, map data, and settings. Without
+        networking no server or client is started, e.g. for benchmarks.
+        With threaded the simulation runs on its own thread, and with
+        process crop growth runs in a separate process."""
         pg.init()
-        self.TileFile = TileFile()
+        self.TileFile = load_tile_file()
         self.TileLookup = TileLookup(self.TileFile)
+        # One id space for sections, network buffers and saves.
+        self.registry = TileRegistry(self.TileFile)
+        Buffer.registry = self.registry
 
-        self.server = ServerMain()
-        self.client = Client(host="127.0.0.1", port=35565)
+        self.networking = networking
+        self.server = None
+        self.client = None
+        if networking:
+            self.server = ServerMain()
+            self.client = Client(host="127.0.0.1", port=35565)
 
         self.screen = pg.display.set_mode((WIDTH, HEIGHT))
         pg.display.set_caption(TITLE)
+        try:
+            image_cache.load_atlas()
+        except FileNotFoundError:
+            print("No texture atlas found, run 'python -m engine.loaders.atlas' to build one")
+        # Anything not in the atlas is loaded on its own.
+        image_cache.preload(list(self.TileFile.images.values()) + ["player_tile"])
         self.dt = 0
         self.clock = pg.time.Clock()
         pg.key.set_repeat(500, 100)
         self.playing = True
         self.gen = Generate()
-        self.iso = Converter()
+        self.iso = converter
         self.interval = INTERVAL
         self.ticks = 0
+        self.threaded = threaded
+        self.process = process
+        self.simulation = None
+        self.stepper = FixedTimestep(INTERVAL / 1000, MAX_STEPS)
+        # Held by each simulation step and by the render loop, so the two
+        # never touch the world at the same time.
+        self.lock = threading.RLock()
+        # How far the simulation is between its last two steps.
+        self.alpha = 1.0
 
         self.gamestate = {}
         self.economy = Economy(STARTINGMONEY)
         self.all_sprites = pg.sprite.Group()
-        self.tiles = pg.sprite.Group()
-        self.grid_background = Grid(self, W, H)
-        self.grid_background.create_grid(1)
-        self.grid_foreground = Grid(self, W, H)
-        self.grid_foreground.create_grid(0)
+        self.entities = DepthQueue()
+        self.world = World(self, width, height, fill=(self.TileLookup.lookup_from_title("grass"), 0))
         self.player = Player(self, 2, 2)
         self.player_pos = {"x": 0, "y": 0}
-        self.camera = Camera(self.grid_background.width, self.grid_background.height)
+        self.camera = Camera(self.world.width, self.world.height)
         self.threads = []
-        self.run_later = TodoList()
+        self.save_thread = None
+        # The error of the last save, if it failed.
+        self.save_error = None
+        self.run_later = TodoList(budget_ms=TODO_BUDGET)
+        # layer -> GrowthSimulation mirroring that layer of the world.
+        self.growth = {}
+        self.schedule_all_growth()
 
         plugins = []
         s_dir = os.getcwd()+"/plugins"
@@ -64,8 +106,9 @@ class Game:
         self.PluginLoader = PluginLoader(self, plugins)
 
     def _run_thread(self):
-        """Method that runs forever."""
+        """Runs one simulation step of INTERVAL milliseconds."""
         self.ticks += INTERVAL
+        self.player.step()
         self.run_later.execute_ready_functions()
         self.animate()
         self.PluginLoader.run()
@@ -73,39 +116,56 @@ class Game:
 
     def _net_thread(self):
         """Method that runs network forever."""
+        if not self.networking:
+            return
         self.server.Pump()
         connection.Pump()
         self.client.Pump()
 
     def new(self):
         """Initialize all variables and do all the setup for a new game."""
+        if not self.networking:
+            return
         self.server.Pump()
         self.client.Pump()
         self.client.Send({"action": "myaction", "blah": 123, "things": [3, 4, 3, 4, 7]})
 
     def run(self):
-        """Game loop."""
+        """Game loop. The simulation advances in fixed steps of INTERVAL
+        milliseconds whatever the frame rate, either between frames or on
+        its own thread."""
+        if self.threaded:
+            thread = SimulationThread(self._run_thread, self.stepper, self.lock)
+            self.threads.append(thread)
+            thread.start()
         while self.playing:
             self.dt = self.clock.tick(FPS) / 1000
             self._net_thread()
-            self._run_thread()
-            # Catch all events.
-            self.events()
-            # Update data.
-            self.update()
-            # Draw updated screen.
-            self.draw()
+            with self.lock:
+                if not self.threaded:
+                    for _ in range(self.stepper.advance(self.dt)):
+                        self._run_thread()
+                self.alpha = self.stepper.alpha
+                # Catch all events.
+                self.events()
+                # Update data.
+                self.update()
+                # Draw updated screen.
+                self.draw()
 
     def quit(self):
         """Quit the game."""
+        self.wait_for_save()
+        if self.simulation is not None:
+            self.simulation.close()
         pg.quit()
         sys.exit()
 
     def update(self):
         # Update everything here.
-        self.grid_background.check_update_grid()
-        self.grid_foreground.check_update_grid()
-        self.all_sprites.update()
+        self.world.update_visible(*self.player.current_position())
+        self.world.check_update_grid()
+        self.all_sprites.update(self.alpha)
         self.camera.update(self.player)
 
         for thread_index in range(0, len(self.threads)):
@@ -115,10 +175,19 @@ class Game:
     def draw(self):
         """Draw the screen."""
         self.screen.fill(BGCOLOR)
-        for tile in self.tiles:
-            self.screen.blit(tile.image, self.camera.apply(tile))
-        for sprite in self.all_sprites:
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        # Only cells and chunks that can overlap the screen are drawn,
+        # one Surface.blits call per layer.
+        view = self.camera.view_rect()
+        margin = image_cache.max_size()
+        offset = self.camera.camera.topleft
+        for layer in self.world.baked:
+            blit_batched(self.screen, self.world.layer_blits(layer, view, margin), offset)
+
+        # Tile sprites and entities are each already in depth order, so
+        # merging them keeps entities correctly occluded without a sort.
+        queues = [self.world.sprite_items(layer, view, margin) for layer in LAYERS if layer not in self.world.baked]
+        items = heapq.merge(*queues, self.entities.items(), key=itemgetter(0))
+        blit_batched(self.screen, [(image, topleft) for _, image, topleft in items], offset)
         pg.display.flip()
 
     def events(self):
@@ -129,13 +198,17 @@ class Game:
             if event.type == pg.KEYDOWN:
                 if event.key == pg.K_ESCAPE:
                     self.save_gamestate()
+                    self.wait_for_save()
 
                     # Stop these threads
                     for thread in self.threads:
                         if thread is not None:
                             thread.stop = True
 
-                    self.server.close()
+                    if self.simulation is not None:
+                        self.simulation.close()
+                    if self.networking:
+                        self.server.close()
                     self.playing = False
                 if event.key == pg.K_LEFT:
                     self.player.move(dx=-1)
@@ -152,65 +225,78 @@ class Game:
                 if event.key == pg.K_SPACE:
                     self.transform_tile()
 
+    def pick_cell(self, pos):
+        """The world cell under a screen pixel, or None."""
+        return self.world.pick(*self.camera.screen_to_world(pos))
+
     def transform_tile(self):
         x, y = self.player.current_position()
-        if isinstance(self.grid_background.grid_data[x][y].data, int):
-            self._dirt_transform(x, y)
-        elif self.grid_background.grid_data[x][y].data == 1:
+        background = self.world.get_tile(BACKGROUND, x, y)
+        # Only tiles with a whole netId (not grass slopes) can be farmed.
+        if isinstance(self.TileFile.net_ids.get(background), int):
             self._dirt_transform(x, y)
         else:
-            print(f'''You can't grow a crop on {self.grid_background.grid_data[x][y].tile_string}!''')
+            print(f'''You can't grow a crop on {self.world.tile_string(BACKGROUND, x, y)}!''')
 
     def change_tile(self, data):
         x, y = self.player.current_position()
         tile_title = self.TileFile.titles[data]
-        back_title = self.grid_background.grid_data[x][y].tile_string
-        if self.grid_background.grid_data[x][y].data != data:
+        back_title = self.world.tile_string(BACKGROUND, x, y)
+        if self.world.get_tile(BACKGROUND, x, y) != data:
             if self.economy.check_transaction(tile_title):
-                self.grid_background.update_tile(data, x, y)
-                self.grid_background.check_update_grid()
+                self.set_tile(BACKGROUND, data, x, y)
+                self.world.check_update_grid()
                 self.economy.buy(tile_title)
         else:
             print(f'''You can't place {tile_title} on a {back_title}!''')
 
     def _dirt_transform(self, x, y):
-        if self.grid_foreground.grid_data[x][y].data >= self.TileLookup.lookup_from_title("orange tulip:flower"):
-            self.economy.sell(self.grid_foreground.grid_data[x][y].tile_string)
-            self.grid_foreground.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
-            self.grid_foreground.grid_data[x][y].multi_states = False
-            self.grid_background.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
-        elif self.grid_background.grid_data[x][y].data == self.TileLookup.lookup_from_title("dirt"):
-            self.grid_foreground.update_tile(self.TileLookup.lookup_from_title("orange tulip:seed"), x, y)
-            self.grid_foreground.check_update_grid()
-            self.grid_foreground.grid_data[x][y].multi_states = True
-            self.economy.buy(self.grid_foreground.grid_data[x][y].tile_string)
+        if self.TileFile.is_grown(self.world.get_tile(FOREGROUND, x, y)):
+            self.economy.sell(self.world.tile_string(FOREGROUND, x, y))
+            self.set_tile(FOREGROUND, self.TileLookup.lookup_from_title("dirt"), x, y)
+            self.set_tile(BACKGROUND, self.TileLookup.lookup_from_title("dirt"), x, y)
+        elif self.world.get_tile(BACKGROUND, x, y) == self.TileLookup.lookup_from_title("dirt"):
+            self.set_tile(FOREGROUND, self.TileLookup.lookup_from_title("orange tulip:seed"), x, y)
+            self.world.check_update_grid()
+            self.economy.buy(self.world.tile_string(FOREGROUND, x, y))
         else:
-            self.grid_background.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
+            self.set_tile(BACKGROUND, self.TileLookup.lookup_from_title("dirt"), x, y)
 
     def save_gamestate(self):
-        self.grid_background.check_update_grid()
-        self.grid_foreground.check_update_grid()
-        d = Data('save_data.txt')
-        maps_dict = {'maps':
-                     {'background': self.grid_background.grid_list(),
-                      'foreground': self.grid_foreground.grid_list()
-                      }}
-        player_dict = {'position':
-                       {'x': self.player.x,
-                        'y': self.player.y
-                        }}
-        economy_dict = {'money': self.economy.money}
-        d.update_file('game state', maps_dict)
-        d.update_file('economy', economy_dict)
-        d.update_file('player', player_dict)
-        d.save_to_file()
+        """Saves the game to its region file. Only the snapshot of changed
+        chunks is taken here; compressing and writing it happens on a
+        worker thread."""
+        self.world.check_update_grid()
+        self.wait_for_save()
+        save = world_save.snapshot(self.world, self.TileFile, self.player, self.economy.money,
+                                   world_save.SAVE_FILE)
+        self.save_thread = WorkerThread(self._write_save, True, False, self.world, *save)
+        self.threads.append(self.save_thread)
+        self.save_thread.start()
+
+    def _write_save(self, world, *save):
+        """Runs on the save thread. A failed save is kept in save_error and
+        reported, and its changes go into the next save."""
+        try:
+            world_save.write_save(world, world_save.SAVE_FILE, *save)
+        except Exception as error:
+            self.save_error = error
+            print(f"Could not save the game: {error}")
+        else:
+            self.save_error = None
+
+    def wait_for_save(self):
+        """Blocks until a save in progress has been written."""
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
 
     def load_gamestate(self):
-        self.player.kill()
-        d = Data('save_data.txt')
+        """Loads a legacy JSON save."""
+        d = Data(world_save.LEGACY_SAVE_FILE)
         self.gamestate = d.load_master_dict('game state')
-        background_list = self.gamestate['maps']['background']
-        foreground_list = self.gamestate['maps']['foreground']
+        background_list = self.TileFile.migrate_layer(self.gamestate['maps']['background'])
+        foreground_list = self.TileFile.migrate_layer(self.gamestate['maps']['foreground'])
         economy = d.load_master_dict('economy')
         player_data = d.load_master_dict('player')
         money = economy['money']
@@ -219,48 +305,66 @@ class Game:
 
     def load(self):
         self.all_sprites = pg.sprite.Group()
-        self.tiles = pg.sprite.Group()
-        money, background_list, foreground_list = self.load_gamestate()
+        self.entities = DepthQueue()
+        self.player.kill()
+        self.wait_for_save()
+        if self.world.source is not None:
+            self.world.source.close()
+        if os.path.exists(world_save.SAVE_FILE):
+            money, self.player_pos, self.world = world_save.load_save(self, world_save.SAVE_FILE)
+        else:
+            money, background_list, foreground_list = self.load_gamestate()
+            self.world = World(self, len(background_list), len(background_list[0]))
+            self.world.load_layer(BACKGROUND, background_list)
+            self.world.load_layer(FOREGROUND, foreground_list)
         self.economy = Economy(money)
-        self.grid_background = Grid(self, len(background_list), len(background_list[0]))
-        self.grid_background.load_grid(background_list)
-        self.grid_foreground = Grid(self, len(foreground_list), len(foreground_list[0]))
-        self.grid_foreground.load_grid(foreground_list)
+        self.schedule_all_growth()
         self.player = Player(self, self.player_pos['x'], self.player_pos['y'])
-        self.camera = Camera(self.grid_background.width, self.grid_background.height)
+        self.camera = Camera(self.world.width, self.world.height)
         self.new()
 
+    def set_tile(self, layer, data, x, y):
+        """Changes a tile in the world and in its growth simulation."""
+        self.world.update_tile(layer, data, x, y)
+        if self.simulation is not None and layer in self.simulation.grids:
+            self.simulation.set_tile(layer, x, y, data)
+        elif layer in self.growth:
+            self.growth[layer].set_tile(x, y, data)
+        elif self.TileFile.grows(data):
+            # The first growing tile of a layer that had no simulation.
+            self.schedule_all_growth()
+
     def animate(self):
-        for row_nb, row in enumerate(self.grid_foreground.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.display_next_state(tile, self.grid_foreground, row_nb, col_nb)
-
-        for row_nb, row in enumerate(self.grid_background.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.display_next_state(tile, self.grid_background, row_nb, col_nb)
-
-    def display_next_state(self, tile: Tile, grid: Grid, row_nb, col_nb):
-        if tile.data != 0:
-            net_name = self.TileLookup.lookup_from_int(tile.data)
-            if tile.multi_states:
-                states = self.TileLookup.lookup_tile_states(net_name)
-                last = list(states)[-1]
-                do_loop = self.TileFile.loop[tile.data]
-                result = self.gen.generate_random_number(0, 1)
-                multiplier = self.TileFile.tick_multiplier[tile.data]
-
-                def actually_display():
-                    string_data = str(tile.data)
-                    split_string = string_data.split(".", 1)
-                    dec = int(split_string[1])+1
-                    new_data = float(split_string[0]+"."+str(dec))
-
-                    if new_data <= last:
-                        if result == 0:
-                            if do_loop:
-                                new_data = self.TileLookup.lookup_from_title(states[0])
-
-                            grid.update_tile(new_data, row_nb, col_nb)
-
-                func = TimeoutFunction(actually_display, self.ticks * multiplier)
-                self.run_later.add_to_list(func)
+        """Advances crop growth by one step, or collects what the simulation
+        process has grown. Returns (layer, xs, ys, ids) arrays of the tiles
+        that changed."""
+        if self.simulation is not None:
+            changes = self.simulation.poll()
+        else:
+            changes = []
+            for layer, growth in self.growth.items():
+                xs, ys, ids = growth.step()
+                if len(ids):
+                    changes.append((layer, xs, ys, ids))
+        for layer, xs, ys, ids in changes:
+            self.world.set_cells(layer, xs, ys, ids)
+        return changes
+
+    def schedule_all_growth(self):
+        """Rebuilds the growth simulations from the world, e.g. after
+        loading a map. Only layers that can hold growing tiles get one."""
+        self.growth = {}
+        if self.simulation is not None:
+            self.simulation.close()
+            self.simulation = None
+        layers = [layer for layer in (FOREGROUND, BACKGROUND) if self.world.growing_chunk_keys(layer)]
+        if not layers:
+            return
+        if self.process:
+            self.simulation = SimulationProcess(
+                self.TileFile, self.world, layers, INTERVAL / 1000, MAX_STEPS)
+            self.simulation.start()
+            return
+        for layer in layers:
+            self.growth[layer] = GrowthSimulation(self.TileFile, self.world.w, self.world.h)
+            self.growth[layer].load(self.world.layer_array(layer, self.world.growing_chunk_keys(layer), np.int32))
@@ -0,0 +1,115 @@
+import numpy as np
+
+# Chance that a due tile moves on to its next state.
+GROW_CHANCE = 0.5
+
+
+class GrowthSimulation:
+    """Grows the multi-state tiles of one world layer in vectorized steps.
+
+    The layer is mirrored as a flat array of tile ids, indexed x * height + y,
+    plus an array holding the step at which each growing tile next tries to
+    grow (-1 for tiles that do not grow). Tiles due at the same step are kept
+    together as index arrays, so a step only looks at the tiles that are due
+    and handles all of them with a few array operations and one batch of
+    random draws, however many crops there are. ids may be given to keep
+    the tile ids in an existing flat int32 buffer, e.g. shared memory."""
+
+    def __init__(self, tile_file, width, height, seed=None, ids=None):
+        self.w = width
+        self.h = height
+
+        # Compiled state tables, indexed by tile id.
+        size = max(tile_file.titles, default=0) + 1
+        self.next_state = np.arange(size)
+        self.delay = np.ones(size, dtype=np.int64)
+        for tile_id, next_id in tile_file.next_state.items():
+            self.next_state[tile_id] = next_id
+            self.delay[tile_id] = max(1, tile_file.tick_multiplier[tile_id])
+        self.grows = self.next_state != np.arange(size)
+        # The distinct delays of growing tiles, usually one per kind of crop.
+        self.delays = np.unique(self.delay[self.grows]).tolist()
+
+        self.ids = np.zeros(width * height, dtype=np.int32) if ids is None else ids
+        self.due = np.full(width * height, -1, dtype=np.int32)
+        # step -> index arrays of the tiles due then. Entries whose tile has
+        # since been changed are skipped when their step comes.
+        self.pending = {}
+        self.now = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        """Number of tiles that are still growing."""
+        return int(np.count_nonzero(self.due >= 0))
+
+    def load(self, ids, spread=True):
+        """Replaces the layer with an array of tile ids indexed [x, y] and
+        schedules every growing tile. Saves hold no timers, so with spread
+        each tile's first attempt is at a random point within its delay,
+        rather than the whole map being due on the same step and staying
+        in step afterwards."""
+        self.ids[:] = np.asarray(ids, dtype=np.int32).ravel()
+        self.due[:] = -1
+        self.pending = {}
+        indices = np.flatnonzero(self.grows[self.ids])
+        if not spread or not len(indices):
+            self._schedule(indices)
+            return
+
+        delay = self.delay[self.ids[indices]]
+        due = self.now + 1 + (self.rng.random(len(indices)) * delay).astype(np.int64)
+        self.due[indices] = due
+        order = np.argsort(due, kind='stable')
+        indices, due = indices[order], due[order]
+        starts = np.flatnonzero(np.r_[True, due[1:] != due[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(due)]):
+            self.pending[int(due[start])] = [indices[start:end]]
+
+    def set_tile(self, x, y, data):
+        """Mirrors a single tile change, scheduling or cancelling its growth."""
+        index = x * self.h + y
+        self.ids[index] = data
+        self.due[index] = -1
+        if self.grows[data]:
+            self._schedule(np.array([index]))
+
+    def _schedule(self, indices):
+        if not len(indices):
+            return
+        delay = self.delay[self.ids[indices]]
+        self.due[indices] = self.now + delay
+        if len(self.delays) == 1:
+            self.pending.setdefault(self.now + self.delays[0], []).append(indices)
+            return
+        for step in self.delays:
+            batch = indices[delay == step]
+            if len(batch):
+                self.pending.setdefault(self.now + step, []).append(batch)
+
+    def step(self):
+        """Advances one step. Returns the x, y and new id arrays of the
+        tiles that changed."""
+        self.now += 1
+        batches = self.pending.pop(self.now, None)
+        if not batches:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64)
+
+        indices = np.concatenate(batches) if len(batches) > 1 else batches[0]
+        indices = indices[self.due[indices] == self.now]
+        if len(batches) > 1:
+            # A tile rescheduled to the same step is listed twice; stamping
+            # each tile with its position keeps only its last listing.
+            positions = np.arange(len(indices))
+            self.due[indices] = positions
+            indices = indices[self.due[indices] == positions]
+        ids = self.ids[indices]
+
+        grown = self.rng.random(len(indices)) < GROW_CHANCE
+        changed = indices[grown]
+        self.ids[changed] = self.next_state[ids[grown]]
+
+        self.due[indices] = -1
+        self._schedule(indices[self.grows[self.ids[indices]]])
+
+        xs, ys = np.divmod(changed, self.h)
+        return xs, ys, self.ids[changed]
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pygame as pg
+
+from .tile_loader import load_tile_file
+
+ATLAS_DIR = "images/atlas"
+MANIFEST = "atlas.json"
+PAGE_SIZE = 2048
+
+
+def pack_rects(sizes, page_size=PAGE_SIZE):
+    """Shelf-packs (name, (w, h)) pairs onto pages of page_size x page_size.
+    Returns {name: (page, x, y, w, h)} and the (w, h) used on each page."""
+    placed = {}
+    pages = []
+    page = x = y = shelf = 0
+    used_w = used_h = 0
+    for name, (w, h) in sorted(sizes, key=lambda item: (-item[1][1], item[0])):
+        if x + w > page_size:
+            x, y, shelf = 0, y + shelf, 0
+        if y + h > page_size:
+            pages.append((used_w, used_h))
+            page, x, y, shelf = page + 1, 0, 0, 0
+            used_w = used_h = 0
+        placed[name] = (page, x, y, w, h)
+        x += w
+        shelf = max(shelf, h)
+        used_w, used_h = max(used_w, x), max(used_h, y + h)
+    pages.append((used_w, used_h))
+    return placed, pages
+
+
+def build_atlas(tile_file, directory="images", out_dir=ATLAS_DIR, extra_images=("player_tile",)):
+    """Packs every image referenced by a TileFile (plus extra_images) into
+    atlas pages and writes them with a manifest of source rects."""
+    names = sorted(set(tile_file.images.values()) | set(extra_images))
+    images = {name: pg.image.load(f"""{directory}/{name}.png""") for name in names}
+    placed, page_sizes = pack_rects([(name, image.get_size()) for name, image in images.items()])
+
+    pages = [pg.Surface(size, pg.SRCALPHA) for size in page_sizes]
+    for name, (page, x, y, _, _) in placed.items():
+        pages[page].blit(images[name], (x, y))
+
+    os.makedirs(out_dir, exist_ok=True)
+    page_files = []
+    for index, page in enumerate(pages):
+        page_files.append(f"""atlas_{index}.png""")
+        pg.image.save(page, os.path.join(out_dir, page_files[-1]))
+
+    manifest = {
+        "pages": page_files,
+        "images": {name: list(rect) for name, rect in placed.items()},
+        # Modification time and size of each source PNG, so edited images
+        # can be told apart from what was packed.
+        "sources": {name: source_stamp(f"""{directory}/{name}.png""") for name in names},
+    }
+    with open(os.path.join(out_dir, MANIFEST), 'w') as outfile:
+        json.dump(manifest, outfile, indent=4)
+    return manifest
+
+
+def source_stamp(path):
+    """[mtime_ns, size] of an image file, as recorded in the manifest."""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_manifest(out_dir=ATLAS_DIR):
+    with open(os.path.join(out_dir, MANIFEST)) as infile:
+        return json.load(infile)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pg.init()
+    atlas = build_atlas(load_tile_file())
+    print(f"""Packed {len(atlas['images'])} images onto {len(atlas['pages'])} page(s) in {ATLAS_DIR}""")
@@ -0,0 +1,100 @@
+import os
+
+import pygame as pg
+
+from .atlas import ATLAS_DIR, load_manifest, source_stamp
+
+
+class ImageCache:
+    """Process-wide store of decoded tile surfaces, so every sprite showing the
+    same image shares one surface instead of loading its own copy."""
+
+    def __init__(self, directory="images"):
+        self.directory = directory
+        self.surfaces = {}
+        # Pixel format the cached surfaces were converted to.
+        self.display_format = None
+        # Directory of the atlas the surfaces come from, if any.
+        self.atlas = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def current_format():
+        """The pixel format of the display surface, or None without one."""
+        surface = pg.display.get_surface()
+        if surface is None:
+            return None
+        return surface.get_bitsize(), surface.get_masks()
+
+    def get(self, name):
+        """Returns the surface for an image name such as "grass/flat"."""
+        display_format = self.current_format()
+        if display_format != self.display_format:
+            # Converted surfaces are only valid for the display they were made for.
+            self.evict()
+            self.display_format = display_format
+            if self.atlas is not None:
+                self.load_atlas(self.atlas)
+
+        surface = self.surfaces.get(name)
+        if surface is not None:
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = pg.image.load(f"""{self.directory}/{name}.png""")
+        if display_format is not None:
+            surface = surface.convert_alpha()
+        self.surfaces[name] = surface
+        return surface
+
+    def preload(self, names):
+        """Loads every named image up front, e.g. TileFile.images.values()."""
+        for name in set(names):
+            self.get(name)
+
+    def load_atlas(self, atlas_dir=ATLAS_DIR):
+        """Loads the pages of a texture atlas built by loaders.atlas and serves
+        its images as subsurfaces of them. Images whose PNG has changed since
+        the atlas was built are left to be loaded from the PNG. Raises
+        FileNotFoundError if the atlas has not been built."""
+        manifest = load_manifest(atlas_dir)
+        self.display_format = self.current_format()
+        pages = []
+        for page in manifest["pages"]:
+            surface = pg.image.load(os.path.join(atlas_dir, page))
+            if self.display_format is not None:
+                surface = surface.convert_alpha()
+            pages.append(surface)
+
+        sources = manifest.get("sources", {})
+        for name, (page, x, y, w, h) in manifest["images"].items():
+            if self._is_stale(name, sources.get(name)):
+                self.surfaces.pop(name, None)
+                continue
+            self.surfaces[name] = pages[page].subsurface((x, y, w, h))
+        self.atlas = atlas_dir
+        return manifest
+
+    def _is_stale(self, name, stamp):
+        try:
+            return stamp != source_stamp(f"""{self.directory}/{name}.png""")
+        except OSError:
+            # Packed images whose PNG is gone are still served.
+            return False
+
+    def evict(self):
+        """Drops all cached surfaces, e.g. after the display mode changes."""
+        self.surfaces = {}
+
+    def max_size(self):
+        """The largest width and height of any cached image."""
+        sizes = [surface.get_size() for surface in self.surfaces.values()]
+        return max((w for w, _ in sizes), default=0), max((h for _, h in sizes), default=0)
+
+    def stats(self):
+        return {"images": len(self.surfaces), "hits": self.hits, "misses": self.misses}
+
+
+image_cache = ImageCache()
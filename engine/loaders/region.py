@@ -0,0 +1,229 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+MAGIC = b"MCRG"
+REGION_VERSION = 1
+SECTOR = 256
+# Magic, version, chunks across, chunks down, metadata sector and sector count.
+_HEADER = struct.Struct(">4sHxxIIII")
+_TABLE_OFFSET = 32
+# Per chunk: first sector, sector count and flags. A count of 0 means the
+# chunk is not stored.
+_ENTRY = np.dtype(">u4")
+_ENTRY_SIZE = 3 * _ENTRY.itemsize
+# Blob length and compression, ahead of the data of each blob.
+_BLOB = struct.Struct(">IB")
+ZLIB = 1
+
+""" A region file holds the chunks of one world, each compressed on its own:
+    sector 0..     header and a fixed size table with one entry per chunk
+    then           blobs, each starting on a SECTOR boundary
+    The file is read through mmap and opening it only reads the header, so a
+    chunk costs nothing until it is first read. Rewritten chunks and
+    metadata are appended and their entries pointed at the new copy, so a
+    save only writes what changed; compact() drops the stale copies."""
+
+
+def _sectors(size):
+    return -(-size // SECTOR)
+
+
+class Region:
+    """A region file opened for reading and appending. Reads and writes may
+    come from different threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.map = None
+        self.table = None
+        self._file = open(path, 'r+b')
+        try:
+            self._map()
+        except Exception:
+            self._file.close()
+            raise
+
+    @classmethod
+    def create(cls, path, width, height):
+        """Creates an empty region file for width x height chunks, replacing
+        any file at path."""
+        with open(path + ".tmp", 'wb') as outfile:
+            outfile.write(_header(width, height, 0, 0))
+            outfile.truncate(_header_sectors(width, height) * SECTOR)
+        os.replace(path + ".tmp", path)
+        return cls(path)
+
+    def _unmap(self):
+        # The table is a view of the map, which cannot close while it exists.
+        self.table = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def _map(self):
+        self._unmap()
+        self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, self.meta_sector, self.meta_sectors = \
+            _HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a region file")
+        if version != REGION_VERSION:
+            raise ValueError(f"{self.path} has unsupported region version {version}")
+        # A view onto the mapped table, so entries written later show up here.
+        self.table = np.frombuffer(self.map, dtype=_ENTRY, count=self.width * self.height * 3,
+                                   offset=_TABLE_OFFSET).reshape(-1, 3)
+
+    def _index(self, cx, cy):
+        if not (0 <= cx < self.width and 0 <= cy < self.height):
+            raise IndexError(f"chunk {cx}:{cy} is outside the region")
+        return cx * self.height + cy
+
+    def __contains__(self, key):
+        """Whether the chunk at key (cx, cy) is stored."""
+        with self.lock:
+            return bool(self.table[self._index(*key), 1])
+
+    def flags(self, cx, cy):
+        """The flags stored with a chunk, 0 for chunks that are not stored."""
+        with self.lock:
+            return int(self.table[self._index(cx, cy), 2])
+
+    def stored(self, flags=0):
+        """Returns a list of the (cx, cy) of every stored chunk, or of those
+        with all of flags set."""
+        with self.lock:
+            indices = np.flatnonzero((self.table[:, 1] != 0) & ((self.table[:, 2] & flags) == flags))
+        return [divmod(int(index), self.height) for index in indices]
+
+    def read(self, cx, cy):
+        """Returns the data of a chunk, or None if it is not stored."""
+        with self.lock:
+            sector, count, _ = self.table[self._index(cx, cy)].tolist()
+            return self._read_blob(sector, count)
+
+    def read_metadata(self):
+        """Returns the metadata, or None if none has been written."""
+        with self.lock:
+            return self._read_blob(self.meta_sector, self.meta_sectors)
+
+    def _read_blob(self, sector, count):
+        if not count:
+            return None
+        start = sector * SECTOR
+        if start + count * SECTOR > len(self.map):
+            # Appended since the file was mapped.
+            self._map()
+        length, compression = _BLOB.unpack_from(self.map, start)
+        if compression != ZLIB:
+            raise ValueError(f"{self.path} has a blob with unknown compression {compression}")
+        return zlib.decompress(self.map[start + _BLOB.size:start + _BLOB.size + length])
+
+    def write(self, chunks, metadata=None):
+        """Writes chunks given as {(cx, cy): (data, flags)}, data being None
+        for chunks that should no longer be stored, and the metadata, if
+        given. Blobs are appended and synced before any entry points at
+        them, so an interrupted write leaves each chunk old or new."""
+        blobs = {key: _blob(data) for key, (data, _) in chunks.items() if data is not None}
+        meta = _blob(metadata) if metadata is not None else None
+        with self.lock:
+            end = _sectors(os.fstat(self._file.fileno()).st_size)
+            entries = {}
+            for key, (data, flags) in chunks.items():
+                blob = blobs.get(key)
+                if blob is None:
+                    entries[self._index(*key)] = (0, 0, 0)
+                    continue
+                self._write_at(end * SECTOR, blob)
+                entries[self._index(*key)] = (end, len(blob) // SECTOR, flags)
+                end += len(blob) // SECTOR
+            if meta is not None:
+                self._write_at(end * SECTOR, meta)
+                meta_entry = (end, len(meta) // SECTOR)
+            self._sync()
+
+            for index, entry in entries.items():
+                self._write_at(_TABLE_OFFSET + index * _ENTRY_SIZE, struct.pack(">3I", *entry))
+            if meta is not None:
+                self.meta_sector, self.meta_sectors = meta_entry
+                self._write_at(0, _header(self.width, self.height, *meta_entry))
+            self._sync()
+
+    def _write_at(self, offset, data):
+        self._file.seek(offset)
+        self._file.write(data)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def sectors(self):
+        """Returns (live, total) sector counts. The difference is held by
+        stale copies that compact() would drop."""
+        with self.lock:
+            live = _header_sectors(self.width, self.height) + self.meta_sectors + int(self.table[:, 1].sum())
+            return live, _sectors(os.fstat(self._file.fileno()).st_size)
+
+    def compact(self):
+        """Rewrites the file with only the live copy of each blob, copied
+        without recompressing."""
+        with self.lock:
+            # Remapped so blobs appended since the last read are included.
+            self._map()
+            table = np.array(self.table)
+            header = _header_sectors(self.width, self.height)
+            end = header
+            blobs = []
+            for entry in table:
+                sector, count, _ = entry.tolist()
+                if count:
+                    blobs.append(self.map[sector * SECTOR:(sector + count) * SECTOR])
+                    entry[0] = end
+                    end += count
+            meta_sector = end if self.meta_sectors else 0
+            meta = self.map[self.meta_sector * SECTOR:(self.meta_sector + self.meta_sectors) * SECTOR]
+
+            with open(self.path + ".tmp", 'wb') as outfile:
+                outfile.write(_header(self.width, self.height, meta_sector, self.meta_sectors))
+                outfile.seek(_TABLE_OFFSET)
+                outfile.write(table.astype(_ENTRY).tobytes())
+                outfile.seek(header * SECTOR)
+                outfile.writelines(blobs)
+                if self.meta_sectors:
+                    outfile.write(meta)
+                outfile.truncate((end + self.meta_sectors) * SECTOR)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+
+            # Closed first, as an open or mapped file cannot be replaced on
+            # every platform.
+            self._unmap()
+            self._file.close()
+            os.replace(self.path + ".tmp", self.path)
+            self._file = open(self.path, 'r+b')
+            self._map()
+
+    def close(self):
+        with self.lock:
+            self._unmap()
+            self._file.close()
+
+
+def _header_sectors(width, height):
+    return _sectors(_TABLE_OFFSET + width * height * _ENTRY_SIZE)
+
+
+def _header(width, height, meta_sector, meta_sectors):
+    return _HEADER.pack(MAGIC, REGION_VERSION, width, height, meta_sector, meta_sectors)
+
+
+def _blob(data):
+    """Compresses data into a blob padded to whole sectors."""
+    data = zlib.compress(data, 6)
+    blob = _BLOB.pack(len(data), ZLIB) + data
+    return blob + bytes(_sectors(len(blob)) * SECTOR - len(blob))
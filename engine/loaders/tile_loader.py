@@ -1,15 +1,45 @@
+import functools
+import hashlib
+import os
+import pickle
+import sys
+
 from .save_data_handler import Data
 
+TILES_JSON = "images/tiles.json"
+# Compiled TileFile, rebuilt whenever tiles.json changes.
+TILES_CACHE = "images/tiles.cache"
+# Bump when TileFile's tables change shape, so old caches are rebuilt. A
+# cache written by different TileFile code is also rebuilt, see
+# _code_fingerprint().
+CACHE_VERSION = 1
+
 
 class TileFile(Data):
-    def __init__(self):
-        super(TileFile, self).__init__("images/tiles.json")
+    def __init__(self, file_name=TILES_JSON):
+        super(TileFile, self).__init__(file_name)
+
+        # Every tile and tile state gets a dense integer id in the order of
+        # tiles.json, with 0 meaning no tile. The netIds in the JSON (which
+        # use decimals for states, e.g. 3.1, 3.2) are only kept to migrate
+        # old saves.
+        self.net_ids = {0: 0}
+        self.ids = {0: 0}
 
         self.images = {}
         self.titles = {}
         self.multi_states = {}
         self.tick_multiplier = {}
         self.loop = {}
+        # id -> id of the state it grows into, or itself if it never changes
+        self.next_state = {}
+
+        # Lookup indexes: title -> id, id -> base name (the part of the
+        # title before ':'), and base name -> {id: title} of its states in
+        # order.
+        self.title_ids = {}
+        self.base_names = {}
+        self.states = {}
 
         for tile_name, tile in self.data["tiles"].items():
             is_multi_state = tile.get("multiState", False)
@@ -17,22 +47,14 @@ class TileFile(Data):
             if not is_multi_state:
                 if root_inherit is False:
                     try:
-                        self.images[tile["netId"]] = tile["image"]
-                        self.titles[tile["netId"]] = tile_name
-                        self.multi_states[tile["netId"]] = False
-                        self.tick_multiplier[tile["netId"]] = 0
-                        self.loop[tile["netId"]] = False
+                        self._add(tile["netId"], tile["image"], tile_name)
                     except KeyError:
                         pass
                 else:
                     if type(root_inherit) is int:
                         try:
-                            self.images[tile["netId"]] = self.images[root_inherit]
-                            self.titles[tile["netId"]] = tile_name
-                            self.multi_states[tile["netId"]] = False
-                            self.tick_multiplier[tile["netId"]] = 0
-                            self.loop[tile["netId"]] = False
-                        except IndexError:
+                            self._add(tile["netId"], self.images[self.ids[root_inherit]], tile_name)
+                        except KeyError:
                             raise IndexError(f"JSON tile -> {tile_name}.inherit ({root_inherit})." +
                                              f"Tile {root_inherit} does not exist, Have you defined it before?")
                     else:
@@ -40,28 +62,139 @@ class TileFile(Data):
             else:
                 try:
                     states = tile["states"]
+                    state_ids = []
                     for key, value in states.items():
                         if type(value) is dict:
                             state_inherit = value.get("inherit", False)
                             if state_inherit is False:
-                                self.images[value["netId"]] = value["image"]
-                                self.titles[value["netId"]] = tile_name + ":" + key
-                                self.multi_states[value["netId"]] = True
-                                self.tick_multiplier[value["netId"]] = states["tickMultiplier"]
-                                self.loop[value["netId"]] = states["loop"]
+                                image = value["image"]
                             else:
                                 if type(state_inherit) is int:
-                                    self.images[value["netId"]] = self.images[state_inherit]
-                                    self.titles[value["netId"]] = tile_name + ":" + key
-                                    self.multi_states[value["netId"]] = True
-                                    self.tick_multiplier[value["netId"]] = states["tickMultiplier"]
-                                    self.loop[value["netId"]] = states["loop"]
+                                    image = self.images[self.ids[state_inherit]]
                                 else:
                                     raise TypeError(f"JSON tile -> {tile_name}.states.{key}.inherit must be type of "
                                                     f"int or str")
+                            state_ids.append(self._add(value["netId"], image, tile_name + ":" + key, True,
+                                                       states["tickMultiplier"], states["loop"]))
+                    self._link_states(state_ids, states["loop"])
                 except KeyError:
                     pass
 
+        self.error_id = self.ids.get(-1)
+
+    def _add(self, net_id, image, title, multi_state=False, tick_multiplier=0, loop=False):
+        """Gives a tile or state the next free id and fills in its tables."""
+        tile_id = len(self.net_ids)
+        self.net_ids[tile_id] = net_id
+        self.ids[net_id] = tile_id
+        self.images[tile_id] = image
+        self.titles[tile_id] = title
+        self.multi_states[tile_id] = multi_state
+        self.tick_multiplier[tile_id] = tick_multiplier
+        self.loop[tile_id] = loop
+        self.next_state[tile_id] = tile_id
+
+        self.title_ids.setdefault(title, tile_id)
+        base, colon, _ = title.partition(':')
+        self.base_names[tile_id] = base
+        if colon:
+            self.states.setdefault(base, {})[tile_id] = title
+        return tile_id
+
+    def _link_states(self, state_ids, loop):
+        """Points each state at the next one; the last state loops back to
+        the first or stays where it is."""
+        for state_id, next_id in zip(state_ids, state_ids[1:]):
+            self.next_state[state_id] = next_id
+        if loop and state_ids:
+            self.next_state[state_ids[-1]] = state_ids[0]
+
+    def grows(self, tile_id):
+        """True if a tile will still change into another state."""
+        return self.next_state.get(tile_id, tile_id) != tile_id
+
+    def is_grown(self, tile_id):
+        """True for the final state of a multi-state tile that does not loop."""
+        return bool(self.multi_states.get(tile_id)) and not self.grows(tile_id)
+
+    def migrate_layer(self, grid):
+        """Converts a grid of a legacy JSON save, which holds float netIds,
+        to current ids."""
+        return [[self.ids.get(data, self.error_id) for data in column] for column in grid]
+
+
+# TileFiles already loaded by this process, keyed by JSON path.
+_loaded = {}
+
+
+def load_tile_file(file_name=TILES_JSON, cache_file=TILES_CACHE):
+    """Returns the TileFile for a tiles.json, compiling it only when the JSON
+    has changed since the cache was written. The menu, game, server and
+    tools in one process also share a single instance."""
+    stat = os.stat(file_name)
+    tile_file = _loaded.get(file_name)
+    if tile_file is not None and tile_file.source == (stat.st_mtime_ns, stat.st_size):
+        return tile_file
+
+    cached = _read_cache(cache_file)
+    if cached is not None and cached["file_name"] == file_name \
+            and cached["mtime"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+        tile_file = cached["tile_file"]
+    else:
+        # The modification time changed, but the contents may not have.
+        with open(file_name, 'rb') as infile:
+            digest = hashlib.sha256(infile.read()).hexdigest()
+        if cached is not None and cached["file_name"] == file_name and cached["hash"] == digest:
+            tile_file = cached["tile_file"]
+        else:
+            tile_file = TileFile(file_name)
+        _write_cache(cache_file, {
+            "version": CACHE_VERSION, "code": _code_fingerprint(), "file_name": file_name,
+            "mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "tile_file": tile_file})
+
+    tile_file.source = (stat.st_mtime_ns, stat.st_size)
+    _loaded[file_name] = tile_file
+    return tile_file
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as infile:
+            cached = pickle.load(infile)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(cached, dict) or cached.get("version") != CACHE_VERSION:
+        return None
+    fingerprint = _code_fingerprint()
+    if fingerprint is None or cached.get("code") != fingerprint:
+        return None
+    return cached
+
+
+@functools.lru_cache(maxsize=None)
+def _code_fingerprint():
+    """Hash of the source of the modules that define TileFile, so a cache
+    pickled by other code is never loaded. None if the source cannot be
+    read, in which case caches are not trusted."""
+    digest = hashlib.sha256()
+    try:
+        for module in (__name__, Data.__module__):
+            with open(sys.modules[module].__file__, 'rb') as infile:
+                digest.update(infile.read())
+    except (OSError, AttributeError, TypeError):
+        return None
+    return digest.hexdigest()
+
+
+def _write_cache(cache_file, cached):
+    # Written to a temporary file first so a reader never sees half a cache.
+    try:
+        with open(cache_file + ".tmp", 'wb') as outfile:
+            pickle.dump(cached, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + ".tmp", cache_file)
+    except OSError:
+        pass
+
 
 class TileLookup:
     def __init__(self, tileFile):
@@ -72,34 +205,29 @@ class TileLookup:
 
         raise TypeError("tileFile must be type of TileFile")
 
-    def lookup_from_int(self, netId: int) -> str:
-        """The fastest mode of lookup since the names are stored in a netId indexed array
+    def lookup_from_int(self, tileId: int) -> str:
+        """The fastest mode of lookup since the names are stored in an id indexed array
 
-        :param netId :(int) The associated network id of the tile
+        :param tileId :(int) The id of the tile
         """
-        return self.tileFile.titles[netId]
+        return self.tileFile.titles[tileId]
 
     def lookup_from_title(self, title: str) -> int:
-        """The slowest mode of lookup since the we have to loop the tiles array and compare
+        """Looks up a title in the title index built by the TileFile
 
         :param title :(str) The associated title of the tile
         :return has_failed_or_id :If the lookup has failed -1 will be returned else the id will be
         """
-        for tile in self.tileFile.titles:
-            if self.tileFile.titles[tile] == title:
-                return tile
-        return -1
+        return self.tileFile.title_ids.get(title, -1)
 
     def lookup_tile_states(self, title: str) -> dict[...]:
-        """Use a tile name or state name to lookup all the tile's states"""
-        head = self.lookup_base_name(title)
-        states = {}
-        for tile_title in self.tileFile.titles.items():
-            if type(tile_title[1]) is str:
-                if tile_title[1].startswith(head + ":"):
-                    states[self.lookup_from_title(tile_title[1])] = tile_title[1]
-
-        return states
+        """Use a tile name or state name to lookup all the tile's states, as
+        {id: title} in order. The dict is shared, so do not change it."""
+        return self.tileFile.states.get(self.lookup_base_name(title), {})
+
+    def lookup_base_from_int(self, tileId: int) -> str:
+        """Use a tile id to lookup the tile's base name"""
+        return self.tileFile.base_names[tileId]
 
     @staticmethod
     def lookup_base_name(title: str) -> str:
@@ -0,0 +1,215 @@
+import os
+import struct
+
+from ..networking.types import nbt
+from ..settings import CHUNK_SIZE
+from ..types.chunk import PackedArray
+from ..world import World, Section
+from .region import Region
+
+SAVE_FILE = "save_data.region"
+# Saves from before the binary format, loaded with Game.load_gamestate.
+LEGACY_SAVE_FILE = "save_data.txt"
+FORMAT_VERSION = 2
+SECTION_LENGTH = CHUNK_SIZE * CHUNK_SIZE
+# Region flag of chunks holding tiles that still grow, shifted by the layer.
+GROWING = 1
+# Saves compact the region once it is this many times the size of its live data.
+COMPACT_RATIO = 2
+
+""" Saves are region files (see region.py). The metadata is the NBT
+    "" {
+        Version, Width, Height
+        Player { X, Y }
+        Economy { Money }
+        Tiles [ title of each tile id, so ids can be remapped on load ]
+        Fills [ id of each layer in every chunk that is not stored ]}
+    and each stored chunk is the NBT
+    "" {
+        Sections [ per layer { Palette, BitsPerTile, Data } ]}
+    Data is the packed section from TileArray.to_bytes, left out for
+    sections holding a single id. Chunks that are all fill are not stored,
+    and chunks with growing tiles are flagged GROWING << layer, so the
+    simulation knows which chunks to read without reading the rest."""
+
+
+def _long_array(data):
+    return nbt.TagLongArray(PackedArray.from_bytes(data, len(data) // 8, 64, 64))
+
+
+def _int_array(values):
+    return nbt.TagIntArray(PackedArray.from_bytes(struct.pack(f'>{len(values)}i', *values), len(values), 32, 32))
+
+
+def _ints(tag):
+    data = tag.value.to_bytes()
+    return list(struct.unpack(f'>{len(data) // 4}i', data))
+
+
+class SaveFile:
+    """A save opened as the source of a World's chunks. Chunks are only
+    read and decompressed when the world first asks for them."""
+
+    def __init__(self, region, registry, remap=None, error_id=0):
+        self.region = region
+        self.path = region.path
+        self.registry = registry
+        # Saved id -> current id, or None if they are the same.
+        self.remap = remap
+        self.error_id = error_id
+
+    def sections(self, cx, cy):
+        """Returns the sections of a stored chunk, or None."""
+        data = self.region.read(cx, cy)
+        if data is None:
+            return None
+        body = nbt.TagRoot.from_bytes(data).body.value
+        return [_read_section(self.registry, tag.value, self.remap, self.error_id)
+                for tag in body["Sections"].value]
+
+    def growing(self, layer):
+        """Keys of the stored chunks holding growing tiles in layer."""
+        return self.region.stored(GROWING << layer)
+
+    def close(self):
+        self.region.close()
+
+
+def snapshot(world, tile_file, player, money, path=SAVE_FILE):
+    """Encodes what saving the world to path has to write: the chunks
+    changed since the last save, or every chunk for a new file, and the
+    metadata. Returns (region, chunks, metadata) for write_save, which can
+    run on another thread; region is None when a new file is written. The
+    keys of chunks are taken out of world.modified, and write_save puts
+    them back if the write fails."""
+    source = world.source
+    region = source.region if source is not None and source.path == path else None
+    if region is None:
+        keys = world.chunk_keys() if source is not None else list(world.chunks)
+    elif source.remap is not None:
+        # Stored chunks hold the old ids, so all of them are rewritten.
+        keys = world.chunk_keys()
+    else:
+        keys = world.modified
+    world.modified = set()
+
+    chunks = {}
+    for key in keys:
+        chunk = world.chunk(*key)
+        if all(section.is_uniform and section.palette[0] == fill
+               for section, fill in zip(chunk.sections, world.fills)):
+            chunks[key] = (None, 0)
+            continue
+        flags = 0
+        for layer, section in enumerate(chunk.sections):
+            if any(section.count(tile_id) for tile_id in world.growing):
+                flags |= GROWING << layer
+        body = nbt.TagCompound({"Sections": nbt.TagList([_section_tag(section) for section in chunk.sections])})
+        chunks[key] = (nbt.TagRoot.from_body(body).to_bytes(), flags)
+
+    size = max(tile_file.titles, default=0) + 1
+    body = nbt.TagCompound({
+        "Version": nbt.TagInt(FORMAT_VERSION),
+        "Width": nbt.TagInt(world.w),
+        "Height": nbt.TagInt(world.h),
+        "Player": nbt.TagCompound({"X": nbt.TagInt(player.x), "Y": nbt.TagInt(player.y)}),
+        "Economy": nbt.TagCompound({"Money": nbt.TagLong(money)}),
+        "Tiles": nbt.TagList([nbt.TagString(tile_file.titles.get(tile_id, "")) for tile_id in range(size)]),
+        "Fills": _int_array(world.fills),
+    })
+    return region, chunks, nbt.TagRoot.from_body(body).to_bytes()
+
+
+def _section_tag(section):
+    tag = {
+        "Palette": _int_array(list(section.palette)),
+        "BitsPerTile": nbt.TagByte(section.value_width),
+    }
+    if not section.is_uniform:
+        tag["Data"] = _long_array(section.to_bytes())
+    return nbt.TagCompound(tag)
+
+
+def write_save(world, path, region, chunks, metadata):
+    """Writes a snapshot. Changes are appended to the world's region, which
+    is compacted once stale copies outweigh the live data. A new file is
+    written beside path and replaces it only once complete, then becomes
+    the world's source. If writing fails, the chunks are marked modified
+    again so the next save still writes them, and the error is raised."""
+    try:
+        if region is not None:
+            region.write(chunks, metadata)
+        else:
+            new = Region.create(path + ".new", world.cw, world.ch)
+            try:
+                new.write(chunks, metadata)
+            finally:
+                new.close()
+            os.replace(path + ".new", path)
+    except Exception:
+        world.modified.update(chunks)
+        raise
+
+    if region is not None:
+        world.source.remap = None
+        live, total = region.sectors()
+        if total > COMPACT_RATIO * live:
+            region.compact()
+        return
+
+    old, world.source = world.source, SaveFile(Region(path), world.registry)
+    if old is not None:
+        old.close()
+
+
+def load_save(game, path=SAVE_FILE):
+    """Opens a save written by write_save. Only the metadata is read here;
+    the world reads each chunk when it is first used. Returns (money,
+    player position, world)."""
+    region = Region(path)
+    try:
+        data = region.read_metadata()
+        if data is None:
+            raise ValueError(f"{path} has no metadata")
+        body = nbt.TagRoot.from_bytes(data).body.value
+        if body["Version"].value != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported save version {body['Version'].value}")
+    except Exception:
+        region.close()
+        raise
+
+    # Saved id -> current id, by title, in case tiles.json has changed.
+    saved_titles = [tag.value for tag in body["Tiles"].value]
+    remap = {tile_id: game.TileFile.title_ids.get(title, game.TileFile.error_id)
+             for tile_id, title in enumerate(saved_titles) if title}
+    remap[0] = 0
+    if all(tile_id == new_id for tile_id, new_id in remap.items()):
+        remap = None
+
+    fills = _ints(body["Fills"])
+    if remap is not None:
+        fills = [remap.get(fill, game.TileFile.error_id) for fill in fills]
+    source = SaveFile(region, game.registry, remap, game.TileFile.error_id)
+    world = World(game, body["Width"].value, body["Height"].value, fill=tuple(fills), source=source)
+    if (world.cw, world.ch) != (region.width, region.height):
+        region.close()
+        raise ValueError(f"{path} holds {region.width}x{region.height} chunks, not {world.cw}x{world.ch}")
+
+    player = body["Player"].value
+    position = {"x": player["X"].value, "y": player["Y"].value}
+    return body["Economy"].value["Money"].value, position, world
+
+
+def _read_section(registry, tag, remap, error_id):
+    palette = _ints(tag["Palette"])
+    if remap is not None:
+        palette = [remap.get(value, error_id) for value in palette]
+    if "Data" not in tag:
+        return Section.uniform(palette[0], registry, length=SECTION_LENGTH)
+
+    section = Section.from_bytes(tag["Data"].value.to_bytes(), tag["BitsPerTile"].value,
+                                 registry, palette, length=SECTION_LENGTH)
+    if not palette and remap is not None:
+        # Unpaletted sections hold ids directly.
+        section.set_many(range(section.length), [remap.get(value, error_id) for value in section[:]])
+    return section
@@ -109,4 +109,5 @@ class Menu:
             self.mainClock.tick(60)
 
 
-m = Menu()
+if __name__ == "__main__":
+    m = Menu()
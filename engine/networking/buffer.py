@@ -5,7 +5,6 @@ import zlib
 
 from ..networking.types.buffer import BufferUnderrun
 from ..networking.types.uuid import UUID
-from ..networking.types import nbt
 from ..types.registry import OpaqueRegistry
 
 
@@ -441,3 +440,7 @@ class Buffer(object):
         """
 
         return self.unpack('fff')
+
+
+# Imported last: nbt imports Buffer from this module.
+from ..networking.types import nbt
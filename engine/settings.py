@@ -15,6 +15,14 @@ TITLE = "Mega Cities"
 BGCOLOR = DARKGREY
 # Game 'tick' interval in milliseconds
 INTERVAL = 30
+# Milliseconds per frame that delayed functions may run for
+TODO_BUDGET = 4
+# Simulation ticks run per frame at most; time beyond that is dropped
+MAX_STEPS = 5
+# Run the simulation on its own thread instead of between frames
+SIM_THREAD = False
+# Run crop growth in a separate process, sharing tile ids through shared memory
+SIM_PROCESS = False
 
 # Grid settings
 W = 20
@@ -23,6 +31,10 @@ TILEWIDTH = 128
 TILEHEIGHT = 128
 TILEHEIGHT_HALF = TILEHEIGHT / 2
 TILEWIDTH_HALF = TILEWIDTH / 2
+# Width and height of a world chunk, in tiles
+CHUNK_SIZE = 16
+# Chunks around the player's chunk that have sprites loaded
+VIEW_CHUNKS = 1
 
 # Gameplay settings
 STARTINGMONEY = 1000
@@ -2,6 +2,10 @@ import pygame as pg
 
 from .settings import *
 from .converter import *
+from .loaders.image_cache import image_cache
+
+# Depth layer of entities, drawn over the tiles of their own diagonal.
+ENTITY_LAYER = 2
 
 
 class Player(pg.sprite.Sprite):
@@ -11,22 +15,37 @@ class Player(pg.sprite.Sprite):
         self.groups = game.all_sprites
         pg.sprite.Sprite.__init__(self, self.groups)
         self.game = game
-        self.image = pg.image.load(
-            "images/player_tile.png"
-        ).convert_alpha()
+        self.image = image_cache.get("player_tile")
         self.rect = self.image.get_rect()
         self.x = x
         self.y = y
-        self.iso = Converter()
+        self.iso = converter
+        # Isometric positions at the last two simulation steps, drawn
+        # interpolated between them.
+        self.previous = self.current = self.iso.convert_cart(x, y)
+        game.entities.add(self, x, y, ENTITY_LAYER)
 
     def move(self, dx=0, dy=0):
         """Moves the position of the player in cartesian coordinates."""
         self.x += dx
         self.y += dy
+        self.game.entities.move(self, self.x, self.y)
+
+    def kill(self):
+        self.game.entities.remove(self)
+        super(Player, self).kill()
+
+    def step(self):
+        """Records the isometric position at a simulation step."""
+        self.previous = self.current
+        self.current = self.iso.convert_cart(self.x, self.y)
 
-    def update(self):
-        """Updates the isometric position of the player."""
-        self.rect.x, self.rect.y = self.iso.convert_cart(self.x, self.y)
+    def update(self, alpha=1.0):
+        """Updates the isometric position of the player, alpha of the way
+        from the previous simulation step to the latest one."""
+        (px, py), (cx, cy) = self.previous, self.current
+        self.rect.x = round(px + (cx - px) * alpha)
+        self.rect.y = round(py + (cy - py) * alpha)
 
     def current_position(self):
         """Current position of the player in isometric coordinates."""
@@ -34,138 +53,42 @@ class Player(pg.sprite.Sprite):
 
 
 class Tile(pg.sprite.Sprite):
-    """All entities that make up the grid background
-    is currently handled in this class."""
+    """Sprite for a single tile of the world. Tiles are only created
+    for chunks around the player; the tile id itself lives in the world."""
 
-    def __init__(self, grid, game, data, x, y):
+    def __init__(self, world, game, layer, data, x, y):
         super(Tile, self).__init__()
+        self.layer = layer
         self.data = data
         self.game = game
-        self.grid = grid
+        self.world = world
 
-        # Flags to check if other processes are needed.
-        self.flag = False
-        self.sprite_init = True
         self.multi_states = False
         self.x, self.y = x, y
 
         self.tile_data = None
         self.tile_string = None
 
-        if self.data is not None and self.data != 0:
-            self.check_data()
-            self.init_sprite()
-            self.load_sprite()
-
-    def init_sprite(self):
-        """Creates a sprite."""
-        groups = self.game.tiles
-        pg.sprite.Sprite.__init__(self, groups)
-        self.sprite_init = False
+        self.load_sprite()
 
     def load_sprite(self):
         """Gives the sprite an image to show."""
         self.check_data()
-        self.image = pg.image.load(f"""images/{self.tile_data}.png""").convert_alpha()
+        self.image = image_cache.get(self.tile_data)
         self.rect = self.image.get_rect()
-        iso = Converter()
         # Convert cartesian to isometric coordinates
-        self.rect.x, self.rect.y = iso.convert_cart(self.x, self.y)
+        self.rect.x, self.rect.y = converter.convert_cart(self.x, self.y)
 
     def check_data(self):
         """Checks the data in the Tile object
         and selects the image to display."""
-        tiles_len = len(self.game.TileFile.images)-1
-        if self.data > tiles_len:
-            self.data = -1
+        if self.data not in self.game.TileFile.images:
+            self.data = self.game.TileFile.error_id
         self.tile_data = self.game.TileFile.images[self.data]
         self.tile_string = self.game.TileFile.titles[self.data]
         self.multi_states = self.game.TileFile.multi_states[self.data]
 
     def update_tile_image(self):
-        """Updates the tile with a new image and
-        checks to see if the tile needs a sprite now."""
-        if self.sprite_init:
-            self.init_sprite()
-            self.load_sprite()
-            self.flag = False
-        else:
-            self.check_data()
-            self.image = pg.image.load(
-                f"""images/{self.tile_data}.png"""
-            ).convert_alpha()
-            self.flag = False
-
-
-class Grid:
-    def __init__(self, game, width, height):
-        """Initialize a grid object with dimensions width x height that contains
-        Tile objects with specified data. All the tile objects are held in a list
-        array."""
-        self.game = game
-        self.w = width
-        self.h = height
-        self.width = width * TILEWIDTH
-        self.height = height * TILEHEIGHT
-        self.grid_data = [[Tile(None, game, None, None, None) for _ in range(self.w)] for _ in range(self.h)]
-
-    def create_grid(self, data):
-        """Creates a grid with specified data population."""
-        self.grid_data = [[data for _ in range(self.w)] for _ in range(self.h)]
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.grid_data[row_nb][col_nb] = Tile(
-                    self, self.game, data, row_nb, col_nb
-                )
-
-    def load_grid(self, grid_list):
-        self.grid_data = [
-            [0 for _ in range(self.w)] for _ in range(self.h)
-        ]
-        """Saves games states by saving tile_data in a list array."""
-        for row_nb, row in enumerate(grid_list):
-            for col_nb, tile in enumerate(row):
-                if isinstance(col_nb, int) and isinstance(row_nb, int):
-                    self.grid_data[row_nb][col_nb] = Tile(
-                        self, self.game, grid_list[row_nb][col_nb], row_nb, col_nb
-                    )
-                    continue
-
-                raise TypeError(f"row_nb: {row_nb} & col_nb:{col_nb} must be type of int")
-
-    def update_tile(self, data, x, y):
-        """Updates a tile at the specified coordinates."""
-        tile = self.grid_data[x][y]
-        if isinstance(tile, Tile):
-            tile.flag = True
-            tile.data = data
-            return
-
-        raise TypeError("tile must be type of Tile")
-
-    def check_update_grid(self):
-        """Check if the grid needs to be updated."""
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                if isinstance(tile, Tile):
-                    if tile.flag:
-                        tile.update_tile_image()
-                    continue
-
-                raise TypeError(f"tile {row_nb}:{col_nb} must be type of Tile")
-
-    def grid_list(self):
-        grid_list = [
-            [0 for _ in range(len(self.grid_data[1]))]
-            for _ in range(len(self.grid_data))
-        ]
-        """Saves games states by saving tile_data in a list array."""
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                tile = self.grid_data[row_nb][col_nb]
-                if isinstance(tile, Tile):
-                    grid_list[row_nb][col_nb] = tile.data
-                    continue
-
-                raise TypeError(f"tile {row_nb}:{col_nb} must be type of Tile")
-        return grid_list
+        """Updates the tile with a new image."""
+        self.check_data()
+        self.image = image_cache.get(self.tile_data)
@@ -1,37 +1,96 @@
-from datetime import datetime, timedelta
 import heapq
+import itertools
+import time
 
 
 # just holds a function, its arguments, and when we want it to execute.
+# It is also the handle used to cancel or reschedule it once it is queued.
 class TimeoutFunction:
     def __init__(self, function, timeout, *args):
         self.function = function
         self.args = args
-        self.startTime = datetime.now() + timedelta(0, 0, 0, timeout)
+        # timeout is in milliseconds, startTime in monotonic nanoseconds
+        self.startTime = time.monotonic_ns() + int(timeout * 1_000_000)
+        self.cancelled = False
+        # The heap entry currently holding this function, if queued
+        self._entry = None
 
     def execute(self):
         self.function(*self.args)
 
 
 # A "todo" list for all the TimeoutFunctions we want to execute in the future
-# They are sorted in the order they should be executed, thanks to heapq
+# They are sorted in the order they should be executed, thanks to heapq.
+# Entries are [startTime, sequence, function]; the sequence number keeps
+# functions due at the same time in the order they were added, so heapq
+# never has to compare two TimeoutFunctions. Cancelled entries are only
+# marked and are dropped when they reach the top of the heap.
 class TodoList:
-    def __init__(self):
+    def __init__(self, max_calls=None, budget_ms=None):
         self.todo = []
+        self.counter = itertools.count()
+        self.cancelled = 0
+        # Default limits for a single execute_ready_functions call
+        self.max_calls = max_calls
+        self.budget_ms = budget_ms
+
+    def __len__(self):
+        return len(self.todo) - self.cancelled
 
     def add_to_list(self, tFunction):
-        heapq.heappush(self.todo, (tFunction.startTime, tFunction))
-
-    def execute_ready_functions(self):
-        if len(self.todo) > 0:
-            t_function = heapq.heappop(self.todo)[1]
-            while t_function and datetime.now() > t_function.startTime:
-                # execute all the functions that are ready
-                t_function.execute()
-                if len(self.todo) > 0:
-                    t_function = heapq.heappop(self.todo)[1]
-                else:
-                    t_function = None
-            if t_function:
-                # this one's not ready yet, push it back on
-                heapq.heappush(self.todo, (t_function.startTime, t_function))
+        """Queues a TimeoutFunction and returns it as a handle."""
+        if tFunction._entry is not None:
+            self.cancel(tFunction)
+        tFunction.cancelled = False
+        entry = [tFunction.startTime, next(self.counter), tFunction]
+        tFunction._entry = entry
+        heapq.heappush(self.todo, entry)
+        return tFunction
+
+    def call_later(self, timeout, function, *args):
+        """Runs function(*args) in timeout milliseconds."""
+        return self.add_to_list(TimeoutFunction(function, timeout, *args))
+
+    def cancel(self, tFunction):
+        entry = tFunction._entry
+        if entry is None:
+            return
+        entry[2] = None
+        tFunction._entry = None
+        tFunction.cancelled = True
+        self.cancelled += 1
+        # Rebuild once most of the heap is dead, so it cannot grow unbounded
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.todo):
+            self.todo = [entry for entry in self.todo if entry[2] is not None]
+            heapq.heapify(self.todo)
+            self.cancelled = 0
+
+    def reschedule(self, tFunction, timeout):
+        """Moves a function to timeout milliseconds from now."""
+        self.cancel(tFunction)
+        tFunction.startTime = time.monotonic_ns() + int(timeout * 1_000_000)
+        return self.add_to_list(tFunction)
+
+    def execute_ready_functions(self, max_calls=None, budget_ms=None):
+        """Executes the functions that are due, stopping early after
+        max_calls functions or budget_ms milliseconds; whatever is left
+        runs on a later call. Returns the number of functions executed."""
+        max_calls = self.max_calls if max_calls is None else max_calls
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        now = time.monotonic_ns()
+        deadline = None if budget_ms is None else now + int(budget_ms * 1_000_000)
+
+        executed = 0
+        while self.todo and self.todo[0][0] <= now:
+            if max_calls is not None and executed >= max_calls:
+                break
+            if deadline is not None and executed and time.monotonic_ns() > deadline:
+                break
+            _, _, t_function = heapq.heappop(self.todo)
+            if t_function is None:
+                self.cancelled -= 1
+                continue
+            t_function._entry = None
+            t_function.execute()
+            executed += 1
+        return executed
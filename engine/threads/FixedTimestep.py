@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+# Turns real elapsed time into a whole number of fixed-length simulation
+# steps. Time that is not yet a full step stays in the accumulator, and
+# alpha tells the renderer how far it is between the last two steps.
+class FixedTimestep:
+    def __init__(self, step, max_steps=5):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+        self.steps = 0
+        # Seconds of simulation skipped because frames fell too far behind
+        self.dropped = 0.0
+
+    def advance(self, elapsed):
+        """Adds elapsed seconds and returns the number of steps to run now.
+        At most max_steps are returned; older time is dropped so one slow
+        frame cannot snowball into ever longer catch-ups."""
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            self.dropped += (steps - self.max_steps) * self.step
+            steps = self.max_steps
+            self.accumulator %= self.step
+        else:
+            self.accumulator -= steps * self.step
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self):
+        """Fraction of a step elapsed since the last one, for interpolation."""
+        return min(1.0, self.accumulator / self.step)
+
+
+# Runs the simulation steps on their own thread, so the simulation keeps
+# its rate however long frames take to draw. Each step holds lock, which
+# the render loop also holds while it reads or changes game state.
+class SimulationThread(threading.Thread):
+    def __init__(self, function, stepper, lock, daemon=True):
+        super(SimulationThread, self).__init__(daemon=daemon)
+        self.stop = False
+        self.my_func = function
+        self.stepper = stepper
+        self.lock = lock
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stop:
+            now = time.perf_counter()
+            steps = self.stepper.advance(now - last)
+            last = now
+            for _ in range(steps):
+                with self.lock:
+                    self.my_func()
+            # Sleep until the next step is due.
+            time.sleep(max(0.0, self.stepper.step - self.stepper.accumulator))
@@ -0,0 +1,119 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ..growth import GrowthSimulation
+from .FixedTimestep import FixedTimestep
+
+
+# Runs crop growth in a separate process so it does not compete with
+# rendering for the GIL. The tile ids of each simulated layer live in shared
+# memory: the worker writes them, and the game reads them when it is told
+# which cells changed. Tile edits made by the game go to the worker over one
+# queue, and the flat indices of changed cells come back over another.
+class SimulationProcess:
+    def __init__(self, tile_file, world, layers, step, max_steps=5):
+        self.w = world.w
+        self.h = world.h
+        self.blocks = {}
+        self.grids = {}
+        for layer in layers:
+            block = shared_memory.SharedMemory(create=True, size=max(1, self.w * self.h * 4))
+            grid = np.ndarray((self.w, self.h), dtype=np.int32, buffer=block.buf)
+            grid[:] = world.layer_array(layer, world.growing_chunk_keys(layer), np.int32)
+            self.blocks[layer] = block
+            self.grids[layer] = grid
+
+        # spawn rather than fork, so the worker does not inherit pygame.
+        context = mp.get_context("spawn")
+        self.commands = context.Queue()
+        self.changes = context.Queue()
+        self.process = context.Process(
+            target=_simulate, daemon=True,
+            args=(tile_file, self.w, self.h, {layer: block.name for layer, block in self.blocks.items()},
+                  self.commands, self.changes, step, max_steps))
+
+    def start(self):
+        self.process.start()
+
+    def set_tile(self, layer, x, y, data):
+        """Sends a tile edit to the worker."""
+        if layer in self.grids:
+            self.commands.put(("set", layer, x, y, data))
+
+    def poll(self):
+        """Returns (layer, xs, ys, ids) arrays for the cells the worker has
+        changed since the last call."""
+        changed = {}
+        while True:
+            try:
+                layer, indices = self.changes.get_nowait()
+            except queue.Empty:
+                break
+            changed.setdefault(layer, []).append(indices)
+
+        results = []
+        for layer, batches in changed.items():
+            indices = np.unique(np.concatenate(batches))
+            xs, ys = np.divmod(indices, self.h)
+            # Ids are read now rather than sent, so the latest value wins.
+            results.append((layer, xs, ys, self.grids[layer][xs, ys]))
+        return results
+
+    def close(self):
+        """Stops the worker and frees the shared memory."""
+        if self.process.is_alive():
+            self.commands.put(("stop",))
+            self.process.join(timeout=1)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.grids = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+
+def _simulate(tile_file, width, height, names, commands, changes, step, max_steps):
+    """Worker loop: applies edits, runs fixed growth steps and reports the
+    flat indices of changed cells."""
+    blocks = {layer: shared_memory.SharedMemory(name=name) for layer, name in names.items()}
+    simulations = {}
+    for layer, block in blocks.items():
+        ids = np.ndarray((width * height,), dtype=np.int32, buffer=block.buf)
+        simulations[layer] = GrowthSimulation(tile_file, width, height, ids=ids)
+        simulations[layer].load(ids)
+
+    stepper = FixedTimestep(step, max_steps)
+    last = time.perf_counter()
+    running = True
+    while running:
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command[0] == "stop":
+                running = False
+                break
+            _, layer, x, y, data = command
+            simulations[layer].set_tile(x, y, data)
+            # Reported back too, so the game ends up with the worker's order
+            # of edits and growth.
+            changes.put((layer, np.array([x * height + y])))
+
+        now = time.perf_counter()
+        for _ in range(stepper.advance(now - last)):
+            for layer, simulation in simulations.items():
+                xs, ys, _ = simulation.step()
+                if len(xs):
+                    changes.put((layer, xs * height + ys))
+        last = now
+        time.sleep(max(0.0, stepper.step - stepper.accumulator))
+
+    simulations = {}
+    for block in blocks.values():
+        block.close()
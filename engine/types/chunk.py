@@ -1,5 +1,7 @@
-from collections import Sequence, MutableSequence
+import collections
+from collections.abc import Sequence, MutableSequence
 from bitstring import BitArray, Bits
+import numpy as np
 import math
 
 
@@ -193,12 +195,200 @@ class PackedArray(Sequence):
                 pos=self.pos(item)[0])
 
 
+class NumpyPackedArray(PackedArray):
+    """
+    Packed array that stores its sectors in a ``numpy.uint64`` array rather
+    than a ``bitstring.BitArray``. The sector layout and the serialized form
+    are identical to :class:`PackedArray`, so the two are interchangeable on
+    the wire.
+    Besides the usual sequence operations, :meth:`unpack_all` and
+    :meth:`pack_all` decode and encode the whole array in a few vectorized
+    operations, and items may be read or written with integer index arrays.
+    """
+
+    #: The ``numpy.ndarray`` of sectors used for storage.
+    storage = None
+
+    def __repr__(self):
+        return "<NumpyPackedArray length=%d sector_width=%d value_width=%d>" \
+               % (self.length,
+                  self.sector_width,
+                  self.value_width)
+
+    # Constructors ------------------------------------------------------------
+
+    @classmethod
+    def empty(cls, length, sector_width, value_width):
+        """
+        Creates an empty array.
+        """
+
+        obj = cls(None, length, sector_width, value_width)
+        obj.purge()
+        return obj
+
+    @classmethod
+    def from_bytes(cls, bytes_value, length, sector_width, value_width):
+        """
+        Deserialize a packed array from the given bytes.
+        """
+
+        dtype = np.dtype(">u%d" % (sector_width // 8))
+        storage = np.frombuffer(bytes_value, dtype=dtype).astype(np.uint64)
+        return cls(storage, length, sector_width, value_width)
+
+    @classmethod
+    def from_packed_array(cls, packed_array):
+        """
+        Converts a bitstring-backed :class:`PackedArray` to this type.
+        """
+
+        return cls.from_bytes(packed_array.to_bytes(),
+                              packed_array.length,
+                              packed_array.sector_width,
+                              packed_array.value_width)
+
+    # Instance methods --------------------------------------------------------
+
+    def to_bytes(self):
+        """
+        Serialize this packed array to bytes.
+        """
+
+        dtype = np.dtype(">u%d" % (self.sector_width // 8))
+        return self.storage.astype(dtype).tobytes()
+
+    def purge(self):
+        """
+        Initializes the storage.
+        You should not need to call this method.
+        """
+
+        values_per_sector = self.sector_width // self.value_width
+        sector_count = 1 + (self.length - 1) // values_per_sector
+        self.storage = np.zeros(sector_count, dtype=np.uint64)
+
+    def locate(self, idx):
+        """
+        Returns the sector index and bit shift of the value(s) at the given
+        index or index array.
+        You should not need to call this method.
+        """
+
+        sector, value = np.divmod(idx, self.sector_width // self.value_width)
+        return sector, (value * self.value_width).astype(np.uint64)
+
+    def is_empty(self):
+        """
+        Returns true if this packed array is entirely zeros.
+        """
+
+        return not self.storage.any()
+
+    def unpack_all(self):
+        """
+        Returns every value in the array as a ``numpy.ndarray``.
+        """
+
+        values_per_sector = self.sector_width // self.value_width
+        shifts = np.arange(values_per_sector, dtype=np.uint64) * \
+            np.uint64(self.value_width)
+        mask = np.uint64((1 << self.value_width) - 1)
+        values = (self.storage[:, None] >> shifts) & mask
+        return values.ravel()[:self.length]
+
+    def pack_all(self, values):
+        """
+        Replaces every value in the array with those from the given sequence,
+        which must hold exactly :attr:`length` entries.
+        """
+
+        values = np.asarray(values, dtype=np.uint64)
+        if values.shape != (self.length,):
+            raise ValueError("expected %d values, got %d"
+                             % (self.length, values.size))
+
+        values_per_sector = self.sector_width // self.value_width
+        sector_count = 1 + (self.length - 1) // values_per_sector
+        shifts = np.arange(values_per_sector, dtype=np.uint64) * \
+            np.uint64(self.value_width)
+        mask = np.uint64((1 << self.value_width) - 1)
+        padded = np.zeros(sector_count * values_per_sector, dtype=np.uint64)
+        padded[:self.length] = values & mask
+        padded = padded.reshape(sector_count, values_per_sector) << shifts
+        self.storage = np.bitwise_or.reduce(padded, axis=1)
+
+    def get_many(self, indices):
+        """
+        Returns the values at the given index array as a ``numpy.ndarray``.
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+        sector, shift = self.locate(indices)
+        mask = np.uint64((1 << self.value_width) - 1)
+        return (self.storage[sector] >> shift) & mask
+
+    def set_many(self, indices, values):
+        """
+        Sets the values at the given index array. When an index is repeated
+        the last value given for it wins.
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+        values = np.broadcast_to(np.asarray(values, dtype=np.uint64),
+                                 indices.shape)
+
+        # Keep only the last write to each index
+        indices, last = np.unique(indices[::-1], return_index=True)
+        values = values[::-1][last]
+
+        sector, shift = self.locate(indices)
+        mask = np.uint64((1 << self.value_width) - 1)
+        np.bitwise_and.at(self.storage, sector, ~(mask << shift))
+        np.bitwise_or.at(self.storage, sector, (values & mask) << shift)
+
+    # Sequence methods --------------------------------------------------------
+
+    def __iter__(self):
+        return iter(self.unpack_all().tolist())
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return self.unpack_all()[item].tolist()
+        elif isinstance(item, (list, np.ndarray)):
+            return self.get_many(item)
+        else:
+            if not 0 <= item < len(self):
+                raise IndexError(item)
+            sector, shift = divmod(item, self.sector_width // self.value_width)
+            mask = (1 << self.value_width) - 1
+            return (int(self.storage[sector]) >> (shift * self.value_width)) \
+                & mask
+
+    def __setitem__(self, item, value):
+        if isinstance(item, slice):
+            values = self.unpack_all()
+            values[item] = list(value)
+            self.pack_all(values)
+        elif isinstance(item, (list, np.ndarray)):
+            self.set_many(item, value)
+        else:
+            if not 0 <= item < len(self):
+                raise IndexError(item)
+            sector, shift = divmod(item, self.sector_width // self.value_width)
+            shift *= self.value_width
+            mask = (1 << self.value_width) - 1
+            self.storage[sector] = \
+                (int(self.storage[sector]) & ~(mask << shift)) | \
+                ((value & mask) << shift)
+
+
 class TileArray(Sequence):
     """
     This class provides support for tile arrays. It wraps a
     :class:`PackedArray` object and implements tile encoding/decoding,
     palettes, and counting of non-air tiles for lighting purposes. It stores
-    precisely 4096 (16x16x16) values.
+    4096 (16x16x16) values unless another *length* is given.
     All operations associated with fixed-size mutable sequences are supported,
     such as slicing.
     A palette is used when there are fewer than 256 unique values; the value
@@ -207,49 +397,80 @@ class TileArray(Sequence):
     to reclaim space by eliminating unused entries.
     When 256 or more unique values are present, the palette is unused and
     values are stored directly.
+    A tile array in which every tile is the same is stored in *uniform* mode:
+    the palette holds that single value and :attr:`storage` is ``None``.
+    Storage is allocated on the first write of a different value, and
+    :meth:`~tileArray.repack` returns the array to uniform mode when
+    possible.
     """
 
-    #: The :class:`PackedArray` object used for storage.
+    #: The :class:`PackedArray` object used for storage, or ``None`` when
+    #: the array is uniform.
     storage = None
 
+    #: The :class:`PackedArray` type allocated when a uniform array is
+    #: first written with a differing value.
+    storage_class = PackedArray
+
     #: List of encoded tile values. Empty when palette is not used.
     palette = None
 
+    #: Dict mapping encoded tile values to their index in :attr:`palette`.
+    palette_index = None
+
     #: The `Registry` object used to encode/decode tiles
     registry = None
 
+    #: The number of entries in the array
+    length = None
+
     #: The number of non-air tiles
     non_air = None
 
+    #: Dict mapping encoded tile values to their occurrence count
+    counts = None
+
     def __repr__(self):
         return "<tileArray palette=%d storage=%r>" \
                % (len(self.palette), self.storage)
 
     # Constructors ------------------------------------------------------------
 
-    def __init__(self, storage, palette, registry, non_air=-1):
+    def __init__(self, storage, palette, registry, non_air=-1, length=4096):
+        self.length = storage.length if storage is not None else length
         self.storage = storage
         self.palette = palette
         self.registry = registry
         self._non_air = non_air
+        self._counts = None
+        self.reindex_palette()
 
     @classmethod
-    def empty(cls, registry, non_air=-1):
+    def empty(cls, registry, non_air=-1, length=4096):
         """
         Creates an empty tile array.
         """
 
-        storage = PackedArray.empty(4096, 64, 4)
-        palette = [0]
-        return cls(storage, palette, registry, non_air)
+        return cls.uniform(0, registry, non_air, length)
 
     @classmethod
-    def from_bytes(cls, bytes_value, value_width, registry, palette, non_air=-1):
+    def uniform(cls, value, registry, non_air=-1, length=4096):
+        """
+        Creates a tile array where every tile is the given encoded value.
+        No storage is allocated until a different value is written.
+        """
+
+        return cls(None, [value], registry, non_air, length)
+
+    @classmethod
+    def from_bytes(cls, bytes_value, value_width, registry, palette, non_air=-1,
+                   length=4096):
         """
         Deserialize a tile array from the given bytes.
         """
-        storage = PackedArray.from_tile_bytes(bytes_value, value_width)
-        return cls(storage, palette, registry, non_air)
+        storage = cls.storage_class.from_bytes(
+            bytes_value, length, 64, value_width)
+        return cls(storage, palette, registry, non_air, length)
 
     @classmethod
     def from_nbt(cls, section, registry, non_air=-1):
@@ -280,8 +501,52 @@ class TileArray(Sequence):
         Serialize this tile array to bytes.
         """
 
+        if self.storage is None:
+            # All-zero indices into the single-entry palette
+            values_per_sector = 64 // self.value_width
+            sector_count = 1 + (self.length - 1) // values_per_sector
+            return bytes(sector_count * 8)
         return self.storage.to_bytes()
 
+    @property
+    def is_uniform(self):
+        """
+        True if every tile holds the same value and no storage is allocated.
+        """
+
+        return self.storage is None
+
+    @property
+    def value_width(self):
+        """
+        The width in bits of serialized values.
+        """
+
+        if self.storage is None:
+            return get_width(1, self.registry.max_bits)
+        return self.storage.value_width
+
+    def promote(self):
+        """
+        Allocates packed storage for a uniform array. The single palette
+        entry becomes index zero, so the array contents are unchanged.
+        You should not need to call this method.
+        """
+
+        if self.storage is None:
+            self._non_air = self.non_air
+            self._counts = self.counts
+            self.storage = self.storage_class.empty(self.length, 64, 4)
+
+    def reindex_palette(self):
+        """
+        Rebuilds :attr:`palette_index` from :attr:`palette`. Call this after
+        modifying the palette list directly.
+        """
+
+        self.palette_index = {
+            value: idx for idx, value in enumerate(self.palette)}
+
     def is_empty(self):
         """
         Returns true if this tile array is entirely air.
@@ -294,23 +559,65 @@ class TileArray(Sequence):
 
     @property
     def non_air(self):
-        if self._non_air == -1:
-            self._non_air = [
-                self.registry.is_air_tile(obj) for obj in self].count(False)
+        if self.storage is None or self._non_air == -1:
+            self._non_air = sum(
+                count for value, count in self.counts.items()
+                if not self.registry.is_air_tile(
+                    self.registry.decode_tile(value)))
         return self._non_air
 
+    @property
+    def counts(self):
+        """
+        Dict mapping encoded tile values to the number of tiles holding them.
+        This is computed on first use and then kept up to date by writes.
+        """
+
+        if self.storage is None:
+            return {self.palette[0]: self.length}
+        if self._counts is None:
+            values = self._encoded_values()
+            if isinstance(values, np.ndarray):
+                values, counts = np.unique(values, return_counts=True)
+                self._counts = dict(zip(values.tolist(), counts.tolist()))
+            else:
+                self._counts = dict(collections.Counter(values))
+        return self._counts
+
+    def unused_palette_entries(self):
+        """
+        Returns a list of palette entries that no tile refers to.
+        """
+
+        counts = self.counts
+        return [value for value in self.palette if not counts.get(value)]
+
     def repack(self, reserve=None):
         """
         Re-packs internal data to use the smallest possible bits-per-tile by
-        eliminating unused palette entries. This operation is slow as it walks
-        all tiles to determine the new palette.
+        eliminating unused palette entries. Unused entries are found from
+        :attr:`counts`; tiles are only walked when they must be re-encoded.
         """
 
-        # If no reserve is given, we re-compute the palette by walking tiles
+        # Uniform arrays are as compact as they get; storage is allocated
+        # by the write that needs it.
+        if self.storage is None:
+            return
+
+        # If no reserve is given, we re-compute the palette from the counts
         if reserve is None:
-            palette = sorted(set(self))
+            palette = sorted(
+                value for value, count in self.counts.items() if count)
             palette_len = len(palette)
 
+            # Drop storage entirely if only one value remains
+            if palette_len == 1:
+                self.storage = None
+                self.palette[:] = palette
+                self.reindex_palette()
+                self._counts = None
+                return
+
         # Otherwise we just ensure we have enough space to store new entries.
         elif self.palette:
             palette = self.palette[:]
@@ -323,8 +630,10 @@ class TileArray(Sequence):
         # Compute new value width
         value_width = get_width(palette_len, self.registry.max_bits)
 
-        # Exit if there's no change in value width needed
-        if value_width == self.storage.value_width:
+        # Exit if there's no change in value width and no dead entries
+        shrunk = reserve is None and self.palette and \
+            palette_len < len(self.palette)
+        if value_width == self.storage.value_width and not shrunk:
             return
 
         # Switch to unpaletted operation if necessary
@@ -332,22 +641,143 @@ class TileArray(Sequence):
             palette = []
 
         # Save contents
-        values = self[:]
+        values = self._encoded_values()
 
         # Update internals
         self.storage.value_width = value_width
         self.storage.purge()
         self.palette[:] = palette
+        self.reindex_palette()
+        if self._counts is not None:
+            self._counts = {
+                value: count for value, count in self._counts.items()
+                if count}
 
         # Load contents
-        self[:] = values
+        self._load_encoded(values)
+
+    def set_many(self, indices, values):
+        """
+        Sets the tiles at the given indices to the given values. New palette
+        entries are added in one go, so the array is re-packed at most once
+        per call rather than once per new value.
+        """
+
+        indices = list(indices)
+        values = list(values)
+        if len(indices) != len(values):
+            raise ValueError("expected %d values, got %d"
+                             % (len(indices), len(values)))
+
+        encoded = [self.registry.encode_tile(value) for value in values]
+
+        if self.storage is None:
+            if all(value == self.palette[0] for value in encoded):
+                return
+            self.promote()
+
+        if self._counts is not None or self._non_air != -1:
+            final = dict(zip(indices, encoded))
+            if isinstance(self.storage, NumpyPackedArray):
+                old_values = self.storage.get_many(list(final)).tolist()
+            else:
+                old_values = [self.storage[idx] for idx in final]
+            changes = collections.Counter(zip(old_values, final.values()))
+            for (old, new), count in changes.items():
+                if self.palette:
+                    old = self.palette[old]
+                self._track(old, new, count)
+
+        if self.palette:
+            missing = list(dict.fromkeys(
+                value for value in encoded
+                if value not in self.palette_index))
+            if missing:
+                self.repack(reserve=len(missing))
+
+                if self.palette:
+                    for value in missing:
+                        self.palette_index[value] = len(self.palette)
+                        self.palette.append(value)
+
+        if self.palette:
+            encoded = [self.palette_index[value] for value in encoded]
+
+        if isinstance(self.storage, NumpyPackedArray):
+            self.storage.set_many(indices, encoded)
+        else:
+            for idx, value in zip(indices, encoded):
+                self.storage[idx] = value
+
+    def _track(self, old, new, count=1):
+        """
+        Updates :attr:`counts` and :attr:`non_air` for ``count`` tiles
+        changing from one encoded value to another.
+        """
+
+        if old == new:
+            return
+        if self._counts is not None:
+            self._counts[old] -= count
+            self._counts[new] = self._counts.get(new, 0) + count
+        if self._non_air != -1:
+            self._non_air += count * (
+                int(self.registry.is_air_tile(
+                    self.registry.decode_tile(old))) -
+                int(self.registry.is_air_tile(
+                    self.registry.decode_tile(new))))
+
+    def _encoded_values(self):
+        """
+        Returns all encoded (but un-paletted) tile values, as a
+        ``numpy.ndarray`` when the storage supports it or a list otherwise.
+        """
+
+        if self.storage is None:
+            return self.palette * self.length
+
+        if isinstance(self.storage, NumpyPackedArray):
+            values = self.storage.unpack_all()
+            if self.palette:
+                values = np.asarray(self.palette, dtype=np.int64)[values]
+            return values
+
+        values = self.storage[:]
+        if self.palette:
+            values = [self.palette[value] for value in values]
+        return values
+
+    def _load_encoded(self, values):
+        """
+        Writes all encoded (but un-paletted) tile values to storage using the
+        current palette.
+        """
+
+        if isinstance(self.storage, NumpyPackedArray):
+            if self.palette:
+                palette = np.asarray(self.palette, dtype=np.int64)
+                order = np.argsort(palette, kind='stable')
+                values = order[np.searchsorted(palette[order], values)]
+            self.storage.pack_all(values)
+        else:
+            if self.palette:
+                values = [self.palette_index[value] for value in values]
+            self.storage[:] = values
 
     # Sequence methods --------------------------------------------------------
 
     def __len__(self):
-        return 4096
+        return self.length
 
     def __getitem__(self, item):
+        if self.storage is None:
+            value = self.registry.decode_tile(self.palette[0])
+            if isinstance(item, slice):
+                return [value] * len(range(*item.indices(self.length)))
+            if not 0 <= item < self.length:
+                raise IndexError(item)
+            return value
+
         if isinstance(item, slice):
             values = []
             for value in self.storage[item.start:item.stop:item.step]:
@@ -365,29 +795,42 @@ class TileArray(Sequence):
 
     def __setitem__(self, item, value):
         if isinstance(item, slice):
-            for idx in range(*item.indices(4096)):
-                self[idx] = value[idx]
+            self.set_many(range(*item.indices(self.length)), value)
             return
 
-        if self._non_air != -1:
-            self._non_air += int(self.registry.is_air_tile(self[item])) - \
-                             int(self.registry.is_air_tile(value))
-
         value = self.registry.encode_tile(value)
 
+        if self.storage is None:
+            if value == self.palette[0]:
+                return
+            self.promote()
+
+        if self._counts is not None or self._non_air != -1:
+            old = self.storage[item]
+            if self.palette:
+                old = self.palette[old]
+            self._track(old, value)
+
         if self.palette:
             try:
-                value = self.palette.index(value)
-            except ValueError:
+                value = self.palette_index[value]
+            except KeyError:
                 self.repack(reserve=1)
 
                 if self.palette:
+                    self.palette_index[value] = len(self.palette)
                     self.palette.append(value)
                     value = len(self.palette) - 1
 
         self.storage[item] = value
 
     def __iter__(self):
+        if self.storage is None:
+            value = self.registry.decode_tile(self.palette[0])
+            for _ in range(self.length):
+                yield value
+            return
+
         for value in self.storage:
             if self.palette:
                 value = self.palette[value]
@@ -395,22 +838,15 @@ class TileArray(Sequence):
             yield value
 
     def __contains__(self, value):
-        if self.palette:
-            if self.registry.encode_tile(value) not in self.palette:
-                return False
-        return super(TileArray, self).__contains__(value)
+        return self.count(value) > 0
 
     def index(self, value, start=0, stop=None):
-        if self.palette:
-            if self.registry.encode_tile(value) not in self.palette:
-                raise ValueError
+        if not self.count(value):
+            raise ValueError
         return super(TileArray, self).index(value, start, stop)
 
     def count(self, value):
-        if self.palette:
-            if self.registry.encode_tile(value) not in self.palette:
-                return 0
-        return super(TileArray, self).count(value)
+        return self.counts.get(self.registry.encode_tile(value), 0)
 
 
 class _NBTPaletteProxy(MutableSequence):
@@ -57,3 +57,43 @@ class OpaqueRegistry(Registry):
     def encode_tile(self, obj): return obj
     def decode_tile(self, val): return val
     def is_air_tile(self, obj): return obj == 0
+
+
+class TileRegistry(Registry):
+    """
+    Registry backed by a :class:`TileFile`. Tiles are the dense integer ids
+    the tile file gives each tile and state (0 being air), so tile arrays,
+    network buffers and saves all share one compact id space. Tile titles
+    may also be encoded. ``max_bits`` is the width of the greatest id, so
+    unpaletted sections stay as narrow as the catalogue allows.
+    """
+
+    tile_kind = 'mega_cities:tile'
+
+    def __init__(self, tile_file):
+        self.tile_file = tile_file
+        self.ids = set(tile_file.titles) | {0}
+        self.max_bits = max(1, max(self.ids).bit_length())
+
+    def encode(self, kind, obj):
+        if kind == self.tile_kind:
+            return self.encode_tile(obj)
+        return obj
+
+    def decode(self, kind, val):
+        if kind == self.tile_kind:
+            return self.decode_tile(val)
+        return val
+
+    def encode_tile(self, obj):
+        if isinstance(obj, str):
+            return self.tile_file.title_ids.get(obj, self.tile_file.error_id)
+        if obj in self.ids:
+            return obj
+        return self.tile_file.error_id
+
+    def decode_tile(self, val):
+        return val
+
+    def is_air_tile(self, obj):
+        return obj == 0
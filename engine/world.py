@@ -0,0 +1,375 @@
+import math
+
+import numpy as np
+import pygame as pg
+
+from .settings import *
+from .chunk_cache import ChunkLayerCache
+from .converter import converter
+from .sprites import Tile
+from .types.chunk import TileArray, NumpyPackedArray
+
+# World layers, drawn in this order.
+BACKGROUND = 0
+FOREGROUND = 1
+LAYERS = (BACKGROUND, FOREGROUND)
+# Layers drawn from baked chunk surfaces rather than per-tile sprites.
+STATIC_LAYERS = (BACKGROUND,)
+
+
+class Section(TileArray):
+    """Tile ids for one layer of a chunk."""
+    storage_class = NumpyPackedArray
+
+
+class Chunk:
+    """A CHUNK_SIZE x CHUNK_SIZE area of the world with one section per layer."""
+
+    def __init__(self, cx, cy, sections):
+        self.cx = cx
+        self.cy = cy
+        self.sections = sections
+        # Tile sprites keyed by (layer, x, y), only while the chunk is visible.
+        self.sprites = {}
+        self.visible = False
+        self._positions = None
+
+    @staticmethod
+    def index(x, y):
+        """Index into a section of the world coordinates x, y."""
+        return (x % CHUNK_SIZE) * CHUNK_SIZE + y % CHUNK_SIZE
+
+    def positions(self, iso):
+        """Isometric positions of the cells of this chunk as two arrays
+        indexed like its sections, computed once and cached."""
+        if self._positions is None:
+            iso_x, iso_y = iso.convert_grid(self.cx * CHUNK_SIZE, self.cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+            self._positions = iso_x.ravel(), iso_y.ravel()
+        return self._positions
+
+    def cells(self, world):
+        """Yields the world coordinates of every in-bounds cell of this chunk."""
+        x0, y0 = self.cx * CHUNK_SIZE, self.cy * CHUNK_SIZE
+        for x in range(x0, min(x0 + CHUNK_SIZE, world.w)):
+            for y in range(y0, min(y0 + CHUNK_SIZE, world.h)):
+                yield x, y
+
+
+class World:
+    def __init__(self, game, width, height, fill=(0, 0), source=None):
+        """Initialize a world of width x height tiles. Tile ids are held per
+        chunk in packed sections, and Tile sprites only exist for chunks
+        around the player. Chunks are created the first time they are used,
+        read from source if it holds them and otherwise filled with the id
+        in fill for each layer."""
+        self.game = game
+        self.w = width
+        self.h = height
+        self.width = width * TILEWIDTH
+        self.height = height * TILEHEIGHT
+        self.registry = game.registry
+        self.iso = converter
+        self.baked = {layer: ChunkLayerCache(self, layer) for layer in STATIC_LAYERS}
+        self.visible = set()
+        # Back to front cell order of culling blocks, keyed by block shape.
+        self._depth_orders = {}
+        # (layer, x, y) of tiles changed since the last check_update_grid().
+        self.dirty = set()
+        self.cw = -(-width // CHUNK_SIZE)
+        self.ch = -(-height // CHUNK_SIZE)
+        self.fills = list(fill)
+        self.source = source
+        # Ids of the tiles that still change into another state.
+        self.growing = [data for data in game.TileFile.next_state if game.TileFile.grows(data)]
+        # Chunks created so far, keyed by (cx, cy).
+        self.chunks = {}
+        # Keys of the chunks changed since the last save.
+        self.modified = set()
+
+    def _section(self, data):
+        return Section.uniform(data, self.registry,
+                               length=CHUNK_SIZE * CHUNK_SIZE)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h
+
+    def has_chunk(self, cx, cy):
+        return 0 <= cx < self.cw and 0 <= cy < self.ch
+
+    def chunk_keys(self):
+        """The (cx, cy) of every chunk of the world, created or not."""
+        return [(cx, cy) for cx in range(self.cw) for cy in range(self.ch)]
+
+    def chunk(self, cx, cy):
+        """Returns the chunk at cx, cy, creating it on first use."""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            sections = self.source.sections(cx, cy) if self.source is not None else None
+            if sections is None:
+                sections = [self._section(data) for data in self.fills]
+            chunk = self.chunks[cx, cy] = Chunk(cx, cy, sections)
+        return chunk
+
+    def growing_chunk_keys(self, layer):
+        """Keys of the chunks whose section of layer may hold growing tiles:
+        created chunks holding any, and those the source marks as growing.
+        Other chunks are not read, so the simulation only loads what it has
+        to, and a layer without any needs no simulation."""
+        if self.fills[layer] in self.growing:
+            return self.chunk_keys()
+        keys = {key for key, chunk in self.chunks.items()
+                if any(chunk.sections[layer].count(data) for data in self.growing)}
+        if self.source is not None:
+            keys.update(key for key in self.source.growing(layer) if key not in self.chunks)
+        return sorted(keys)
+
+    def chunk_at(self, x, y):
+        """Returns the chunk holding the tile at x, y."""
+        if not self.in_bounds(x, y):
+            raise IndexError(f"tile {x}:{y} is outside the world")
+        return self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)
+
+    def get_tile(self, layer, x, y):
+        """Returns the tile id at the specified coordinates."""
+        return self.chunk_at(x, y).sections[layer][Chunk.index(x, y)]
+
+    def sprite_at(self, layer, x, y):
+        """Returns the sprite of the tile at x, y, or None if it has none."""
+        return self.chunk_at(x, y).sprites.get((layer, x, y))
+
+    def chunk_rect(self, chunk, margin):
+        """The isometric pixel area that the sprites of a chunk, at most
+        margin (w, h) in size, can cover."""
+        x0, y0 = chunk.cx * CHUNK_SIZE, chunk.cy * CHUNK_SIZE
+        x1, y1 = x0 + CHUNK_SIZE - 1, y0 + CHUNK_SIZE - 1
+        left, _ = self.iso.convert_cart(x0, y1)
+        right, _ = self.iso.convert_cart(x1, y0)
+        _, top = self.iso.convert_cart(x0, y0)
+        _, bottom = self.iso.convert_cart(x1, y1)
+        return pg.Rect(left, top, right - left + margin[0], bottom - top + margin[1])
+
+    def visible_chunks(self):
+        """The chunks around the player, in back to front drawing order."""
+        return [self.chunks[key] for key in sorted(self.visible, key=lambda key: (key[0] + key[1], key))]
+
+    def layer_blits(self, layer, rect, margin):
+        """Returns (surface, (x, y)) pairs in isometric pixels for everything
+        of a layer that can overlap rect: one baked surface per chunk for
+        static layers, otherwise one sprite per cell."""
+        if layer in self.baked:
+            items = []
+            for chunk in self.visible_chunks():
+                if rect.colliderect(self.chunk_rect(chunk, margin)):
+                    surface, topleft = self.baked[layer].get(chunk)
+                    if surface is not None:
+                        items.append((surface, topleft))
+            return items
+
+        return [(image, topleft) for _, image, topleft in self.sprite_items(layer, rect, margin)]
+
+    def sprite_items(self, layer, rect, margin):
+        """Returns ((x + y, layer), image, topleft) for the sprites of a layer
+        that can overlap rect, in back to front order."""
+        items = []
+        for x, y in self.cells_in_view(rect, margin):
+            tile = self.sprite_at(layer, x, y)
+            if tile is not None:
+                items.append(((x + y, layer), tile.image, tile.rect.topleft))
+        return items
+
+    def cells_in_view(self, rect, margin):
+        """Returns the in-bounds (x, y) whose sprite, at most margin (w, h) in
+        size, can overlap rect, an area in isometric pixels. Cells are in
+        back to front order, by x + y."""
+        left, top = rect.left - margin[0], rect.top - margin[1]
+        right, bottom = rect.right, rect.bottom
+
+        # Bounding box of the view in cartesian tile coordinates
+        xs, ys = self.iso.convert_iso(np.array([left, right, left, right]), np.array([top, top, bottom, bottom]))
+        x0 = max(0, math.floor(xs.min()))
+        x1 = min(self.w - 1, math.ceil(xs.max()))
+        y0 = max(0, math.floor(ys.min()))
+        y1 = min(self.h - 1, math.ceil(ys.max()))
+        if x0 > x1 or y0 > y1:
+            return []
+
+        shape = x1 - x0 + 1, y1 - y0 + 1
+        px, py = self.iso.convert_grid(x0, y0, *shape)
+        inside = (left <= px) & (px <= right) & (top <= py) & (py <= bottom)
+
+        # The diagonal order only depends on the block shape, so it is
+        # computed once per shape rather than sorted every frame.
+        order = self._depth_orders.get(shape)
+        if order is None:
+            xs, ys = np.indices(shape)
+            order = self._depth_orders[shape] = np.argsort((xs + ys).ravel(), kind='stable')
+        order = order[inside.ravel()[order]]
+        xs, ys = np.divmod(order, shape[1])
+        return list(zip((xs + x0).tolist(), (ys + y0).tolist()))
+
+    def pick(self, iso_x, iso_y):
+        """Returns the cell under an isometric pixel, or None outside the world."""
+        x, y = self.iso.pick(iso_x, iso_y)
+        x, y = int(x), int(y)
+        if not self.in_bounds(x, y):
+            return None
+        return x, y
+
+    def tile_string(self, layer, x, y):
+        """Returns the title of the tile at the specified coordinates."""
+        return self.game.TileFile.titles[self.get_tile(layer, x, y)]
+
+    def update_tile(self, layer, data, x, y):
+        """Updates a tile at the specified coordinates. Its sprite catches up
+        on the next check_update_grid()."""
+        chunk = self.chunk_at(x, y)
+        chunk.sections[layer][Chunk.index(x, y)] = data
+        self.modified.add((chunk.cx, chunk.cy))
+        self.dirty.add((layer, x, y))
+
+    def update_tiles(self, layer, tiles):
+        """Updates a batch of tiles given as (data, x, y) tuples, writing each
+        chunk's section once."""
+        edits = {}
+        for data, x, y in tiles:
+            edits.setdefault(self.chunk_at(x, y), []).append((data, x, y))
+        for chunk, chunk_edits in edits.items():
+            chunk.sections[layer].set_many(
+                [Chunk.index(x, y) for _, x, y in chunk_edits],
+                [data for data, _, _ in chunk_edits])
+            self.modified.add((chunk.cx, chunk.cy))
+            self.dirty.update((layer, x, y) for _, x, y in chunk_edits)
+
+    def set_cells(self, layer, xs, ys, values):
+        """Updates tiles given as arrays of x, y and data, writing each
+        chunk's section once. Changes to baked layers are redrawn into the
+        chunk's surface, and changes to chunks without sprites need nothing
+        more."""
+        xs, ys, values = np.asarray(xs), np.asarray(ys), np.asarray(values)
+        if not len(xs):
+            return
+        keys = (xs // CHUNK_SIZE) * (self.h // CHUNK_SIZE + 1) + ys // CHUNK_SIZE
+        order = np.argsort(keys, kind='stable')
+        xs, ys, values, keys = xs[order], ys[order], values[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(keys)]):
+            cx, cy = xs[start] // CHUNK_SIZE, ys[start] // CHUNK_SIZE
+            chunk = self.chunk(int(cx), int(cy))
+            chunk_xs, chunk_ys = xs[start:end], ys[start:end]
+            chunk.sections[layer].set_many(
+                ((chunk_xs % CHUNK_SIZE) * CHUNK_SIZE + chunk_ys % CHUNK_SIZE).tolist(),
+                values[start:end].tolist())
+            self.modified.add((chunk.cx, chunk.cy))
+            if layer in self.baked:
+                self.baked[layer].redraw(chunk, list(zip(chunk_xs.tolist(), chunk_ys.tolist())))
+            elif chunk.visible:
+                self.dirty.update(zip([layer] * (end - start), chunk_xs.tolist(), chunk_ys.tolist()))
+
+    def fill(self, layer, data):
+        """Sets every tile of a layer to data."""
+        self.fills[layer] = data
+        # Chunks not created yet pick up the new fill, unless the source
+        # holds their own sections.
+        keys = self.chunk_keys() if self.source is not None else list(self.chunks)
+        self.modified.update(keys)
+        for key in keys:
+            chunk = self.chunk(*key)
+            chunk.sections[layer] = self._section(data)
+            self._invalidate(layer, chunk)
+            if chunk.visible:
+                self._hide(chunk)
+                self._show(chunk)
+
+    def load_layer(self, layer, grid_list):
+        """Loads a layer from a list array of tile ids, indexed [x][y]."""
+        self.modified.update(self.chunk_keys())
+        for key in self.chunk_keys():
+            chunk = self.chunk(*key)
+            cells = list(chunk.cells(self))
+            section = self._section(grid_list[cells[0][0]][cells[0][1]])
+            section.set_many([Chunk.index(x, y) for x, y in cells],
+                             [grid_list[x][y] for x, y in cells])
+            section.repack()
+            chunk.sections[layer] = section
+            self._invalidate(layer, chunk)
+            if chunk.visible:
+                self._hide(chunk)
+                self._show(chunk)
+
+    def layer_array(self, layer, keys=None, dtype=np.int64):
+        """A layer as a numpy array of tile ids, indexed [x, y]. If keys is
+        given, only those chunks are read and the rest is left as 0."""
+        grid = np.zeros((self.cw * CHUNK_SIZE, self.ch * CHUNK_SIZE), dtype=dtype)
+        for cx, cy in self.chunk_keys() if keys is None else keys:
+            chunk = self.chunk(cx, cy)
+            grid[cx * CHUNK_SIZE:(cx + 1) * CHUNK_SIZE, cy * CHUNK_SIZE:(cy + 1) * CHUNK_SIZE] = \
+                np.reshape(chunk.sections[layer][:], (CHUNK_SIZE, CHUNK_SIZE))
+        return grid[:self.w, :self.h]
+
+    def update_visible(self, x, y):
+        """Loads sprites for the chunks around x, y and drops the rest."""
+        cx, cy = x // CHUNK_SIZE, y // CHUNK_SIZE
+        wanted = {
+            (cx + dx, cy + dy)
+            for dx in range(-VIEW_CHUNKS, VIEW_CHUNKS + 1)
+            for dy in range(-VIEW_CHUNKS, VIEW_CHUNKS + 1)
+            if self.has_chunk(cx + dx, cy + dy)}
+        if wanted == self.visible:
+            return
+
+        for key in self.visible - wanted:
+            self._hide(self.chunks[key])
+        for key in wanted - self.visible:
+            self._show(self.chunk(*key))
+        self.visible = wanted
+
+    def _show(self, chunk):
+        chunk.visible = True
+        for layer, section in enumerate(chunk.sections):
+            if section.is_empty() or layer in self.baked:
+                continue
+            values = section[:]
+            for x, y in chunk.cells(self):
+                data = values[Chunk.index(x, y)]
+                if data != 0:
+                    chunk.sprites[layer, x, y] = Tile(self, self.game, layer, data, x, y)
+
+    def _hide(self, chunk):
+        chunk.visible = False
+        for tile in chunk.sprites.values():
+            tile.kill()
+        chunk.sprites = {}
+        for layer in self.baked:
+            self._invalidate(layer, chunk)
+
+    def _invalidate(self, layer, chunk):
+        if layer in self.baked:
+            self.baked[layer].invalidate((chunk.cx, chunk.cy))
+
+    def check_update_grid(self):
+        """Brings the sprites of tiles changed since the last call up to date.
+        Only changed tiles are touched, so an idle world costs nothing."""
+        dirty, self.dirty = self.dirty, set()
+        redraws = {}
+        for cell in dirty:
+            layer, x, y = cell
+            chunk = self.chunk_at(x, y)
+            if layer in self.baked:
+                redraws.setdefault((layer, chunk), []).append((x, y))
+                continue
+            if not chunk.visible:
+                continue
+
+            data = chunk.sections[layer][Chunk.index(x, y)]
+            tile = chunk.sprites.get(cell)
+            if tile is None:
+                if data != 0:
+                    chunk.sprites[cell] = Tile(self, self.game, layer, data, x, y)
+            elif data == 0:
+                tile.kill()
+                del chunk.sprites[cell]
+            elif data != tile.data:
+                tile.data = data
+                tile.update_tile_image()
+        for (layer, chunk), cells in redraws.items():
+            self.baked[layer].redraw(chunk, cells)
@@ -1,3 +1,4 @@
-from engine import main
-
-main.main()
+if __name__ == "__main__":
+    # Only start the menu in the main process, not in simulation workers.
+    from engine import main
+    main.Menu()